@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Benchmark batched caption combining against per-image generate_combined_captions, and token packing, on the usroad CSV build"""
+
+import time
+
+from caption_combine import CLIP_TOKEN_BUDGET, combine_captions_batch, estimate_token_counts, pack_captions_batch
+from parse_to_csv import MAX_WORDS, generate_combined_captions, parse_to_json, passes_task_checks
+
+# === CONFIGURATION ===
+INPUT_FILE = "/home/cynapse/terence/database/blip/results/usroad_filelist_temp0_topk1_topp1_readable.txt"
+REPEATS = 5
+COMBINE_SEED = 0
+
+def time_combine(combine_func, images):
+    """Return the best wall time of REPEATS calls over all images"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        combine_func(images)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    # Task 1 captions of passing images, as parse_to_csv.py hands them to the combining step
+    images = [
+        (entry_dict['image'], entry_dict.get('Task 1', []))
+        for entry_dict in parse_to_json(INPUT_FILE)
+        if passes_task_checks(entry_dict)
+    ]
+    caption_count = sum(len(captions) for _, captions in images)
+    print(f"Loaded {len(images)} passing images ({caption_count} captions) from {INPUT_FILE}")
+
+    per_image = lambda images: [generate_combined_captions(captions, MAX_WORDS) for _, captions in images]
+    batched = lambda images: combine_captions_batch(images, MAX_WORDS, COMBINE_SEED)
+
+    # Shuffles differ, so compare what can't: row count and words per image (join commas aside)
+    legacy_rows = per_image(images)
+    batch_rows = batched(images)
+    row_words = lambda rows: sorted(' '.join(rows).replace(',', ' ').split())
+    mismatches = sum(
+        1 for old, new in zip(legacy_rows, batch_rows)
+        if len(old) != len(new) or row_words(old) != row_words(new)
+    )
+    reproducible = batch_rows == batched(images)
+
+    legacy_time = time_combine(per_image, images)
+    batch_time = time_combine(batched, images)
+
+    print(f"  Images with different rows or words: {mismatches}")
+    print(f"  Batch output reproducible: {reproducible}")
+    print(f"  Rows: {sum(len(rows) for rows in batch_rows)}")
+    print(f"  Per-image generate_combined_captions: {legacy_time * 1e6 / len(images):.2f} us/image")
+    print(f"  combine_captions_batch:               {batch_time * 1e6 / len(images):.2f} us/image")
+    print(f"  Speedup: {legacy_time / batch_time:.1f}x")
+
+    # Token packing keeps every caption and should need fewer rows than word groups, none of them over budget
+    packed = lambda images: pack_captions_batch(images, CLIP_TOKEN_BUDGET, seed=COMBINE_SEED)
+    packed_rows = packed(images)
+    over_budget = lambda rows: sum(1 for count in estimate_token_counts([row for image_rows in rows for row in image_rows]) if count > CLIP_TOKEN_BUDGET)
+    unpackable = sum(1 for count in estimate_token_counts([c for _, captions in images for c in captions]) if count > CLIP_TOKEN_BUDGET)
+    packed_mismatches = sum(1 for old, new in zip(legacy_rows, packed_rows) if row_words(old) != row_words(new))
+    packed_time = time_combine(packed, images)
+
+    print(f"Token packing ({CLIP_TOKEN_BUDGET} estimated tokens per row):")
+    print(f"  Images with different words: {packed_mismatches}")
+    print(f"  Rows: {sum(len(rows) for rows in packed_rows)} (word groups: {sum(len(rows) for rows in batch_rows)})")
+    print(f"  Rows over budget: {over_budget(packed_rows)} (word groups: {over_budget(batch_rows)}, single captions over budget: {unpackable})")
+    print(f"  pack_captions_batch: {packed_time * 1e6 / len(images):.2f} us/image")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Microbenchmark the compiled tag filter against the original regex-per-line filter_tags"""
+
+import re
+import time
+
+from entry_parser import build_tag_filter, iter_entry_blocks
+from parse_to_csv_task_3 import INCLUDE_TAGS
+
+# === CONFIGURATION ===
+INPUT_FILE = '/home/cynapse/zhenyang/caption_parser/caption_input_txt/example_prompt_output_long'
+REPEATS = 20
+
+def legacy_filter_tags(line, include_tags, include_all_tags):
+    """Original filter_tags implementation, kept here as the benchmark baseline"""
+    if not line:
+        return line.strip()
+    
+    if include_all_tags:
+        return re.sub(r'\[.*?\]\s*', '', line).strip()
+    
+    tags = re.findall(r'\[.*?\]', line)
+    if not tags:
+        return line.strip()
+    
+    has_enabled_tag = any(tag in include_tags and include_tags[tag] for tag in tags)
+    if not has_enabled_tag:
+        return ''
+    
+    result_parts = []
+    parts = re.split(r'(\[.*?\])', line)
+    
+    for i, part in enumerate(parts):
+        if part.startswith('[') and part.endswith(']'):
+            tag = part
+            if tag in include_tags and include_tags[tag]:
+                if i + 1 < len(parts):
+                    content = parts[i + 1].strip()
+                    if content:
+                        result_parts.append(content)
+    
+    return ' '.join(result_parts).strip()
+
+def time_filter(filter_func, lines):
+    """Return the best wall time of REPEATS passes over lines"""
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for line in lines:
+            filter_func(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    # Content lines exactly as parse_entry hands them to the filter
+    lines = []
+    for entry in iter_entry_blocks(INPUT_FILE):
+        for line in entry.strip().split('\n')[1:]:
+            line = line.strip()
+            if line and not line.startswith('Task '):
+                lines.append(line)
+    print(f"Loaded {len(lines)} content lines from {INPUT_FILE}")
+    
+    for include_all_tags in (False, True):
+        compiled_filter = build_tag_filter(INCLUDE_TAGS, include_all_tags)
+        legacy_filter = lambda line: legacy_filter_tags(line, INCLUDE_TAGS, include_all_tags)
+        
+        mismatches = sum(1 for line in lines if compiled_filter(line) != legacy_filter(line))
+        legacy_time = time_filter(legacy_filter, lines)
+        compiled_time = time_filter(compiled_filter, lines)
+        
+        print(f"\nINCLUDE_ALL_TAGS: {include_all_tags}")
+        print(f"  Mismatched lines: {mismatches}")
+        print(f"  Legacy filter_tags: {legacy_time * 1e6 / len(lines):.2f} us/line")
+        print(f"  Compiled filter:    {compiled_time * 1e6 / len(lines):.2f} us/line")
+        print(f"  Speedup: {legacy_time / compiled_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
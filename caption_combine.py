@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Batched caption combining - even word-count groups (generate_combined_captions) or token-budget packing, per-image seeded"""
+
+import re
+import zlib
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+
+import numpy as np
+
+# === CONFIGURATION ===
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)  # splitmix64 stream increment
+SEPARATOR = ", "
+COMBINE_MODES = ('words', 'tokens')  # Even groups of about max_words words, or fewest rows that fit token_budget
+CLIP_TOKEN_BUDGET = 75  # CLIP's 77-token context minus the start and end tokens
+CLIP_TOKENIZER_NAME = 'openai/clip-vit-base-patch32'
+CHARS_PER_WORD_TOKEN = 8  # Estimator: letters per BPE token in long words (common short words are one token)
+# CLIP's pre-tokenizer split, minus the special tokens: contractions, letter runs, single digits, punctuation runs
+CLIP_PRETOKEN_PATTERN = re.compile(r"'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|[^\s\w]+|_+")
+LONG_WORD_PATTERN = re.compile(rf"[^\W\d_]{{{CHARS_PER_WORD_TOKEN + 1},}}")
+
+def splitmix64(x):
+    """splitmix64 output function over a uint64 array - a counter-based RNG, so draws need no state"""
+    x = x + GOLDEN_GAMMA
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def image_seeds(seed, image_paths):
+    """64-bit RNG stream seed per image, stable across runs and batches"""
+    path_hashes = np.fromiter((zlib.crc32(image_path.encode('utf-8')) for image_path in image_paths), dtype=np.uint64)
+    return splitmix64(splitmix64(np.full(len(path_hashes), seed % 2 ** 64, dtype=np.uint64)) ^ path_hashes)
+
+def combine_captions_batch(images, max_words=20, seed=0):
+    """Combine the captions of many (image_path, captions) pairs, returning one combined caption list per image
+
+    Group count and sizes follow generate_combined_captions. Each image is shuffled by its own
+    RNG stream, so its result depends only on seed, image path and captions - not on the batch.
+    """
+    counts = np.array([len(captions) for _, captions in images], dtype=np.int64)
+    flat = [caption for _, captions in images for caption in captions]
+    if not flat:
+        return [[] for _ in images]
+
+    # Words per image in one split of its joined captions - same total as splitting them one by one
+    total_words = np.array([len(' '.join(captions).split()) for _, captions in images], dtype=np.int64)
+    groups = np.minimum(np.maximum(1, total_words // max_words + 1), np.maximum(counts, 1))
+    per_group = counts // groups
+    remainder = counts % groups
+
+    owner = np.repeat(np.arange(len(images), dtype=np.uint64), counts)
+    position = np.arange(len(flat), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Shuffle within each image by sorting on (image, per-image random key); images stay contiguous
+    seeds = image_seeds(seed, [image_path for image_path, _ in images])
+    keys = splitmix64(np.repeat(seeds, counts) + position.astype(np.uint64) * GOLDEN_GAMMA)
+    order = np.argsort((owner << np.uint64(32)) | (keys >> np.uint64(32)), kind='stable')
+
+    # Group of each shuffled slot - the first 'remainder' groups of an image get one extra caption
+    long_slots = np.repeat(remainder * (per_group + 1), counts)
+    group = np.where(
+        position < long_slots,
+        position // np.repeat(per_group + 1, counts),
+        np.repeat(remainder, counts) + (position - long_slots) // np.repeat(np.maximum(per_group, 1), counts)
+    )
+    group_id = np.repeat(np.cumsum(groups) - groups, counts) + group
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(group_id)) + 1)).tolist()
+    ends = starts[1:] + [len(flat)]
+
+    shuffled = itemgetter(*order.tolist())(flat) if len(flat) > 1 else tuple(flat)
+    joined = iter([SEPARATOR.join(shuffled[start:end]) for start, end in zip(starts, ends)])
+    # Images own consecutive groups, 'groups' of them each (none for an image without captions)
+    return [list(islice(joined, group_count)) for group_count in np.where(counts > 0, groups, 0).tolist()]
+
+def estimate_token_counts(texts):
+    """Rough CLIP BPE token count per text - one token per pre-token, plus one per further 8 letters of a long word"""
+    return [
+        len(CLIP_PRETOKEN_PATTERN.findall(text))
+        + sum((len(word) - 1) // CHARS_PER_WORD_TOKEN for word in LONG_WORD_PATTERN.findall(text))
+        for text in texts
+    ]
+
+@lru_cache(maxsize=None)
+def clip_token_counter(model_name=CLIP_TOKENIZER_NAME):
+    """Exact CLIP token counts from a Hugging Face tokenizer, usable as pack_captions_batch's count_tokens"""
+    try:
+        from transformers import CLIPTokenizerFast
+    except ImportError:
+        raise ImportError("Exact token counts need the transformers package (pip install transformers)")
+    tokenizer = CLIPTokenizerFast.from_pretrained(model_name)
+
+    def count_tokens(texts):
+        return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
+    return count_tokens
+
+def first_fit_decreasing(sizes, budget, separator_size):
+    """Pack item indices into as few bins as FFD finds, where a bin holds sizes plus a separator between items"""
+    bins = []
+    loads = []
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for b, load in enumerate(loads):
+            if load + separator_size + sizes[i] <= budget:
+                bins[b].append(i)
+                loads[b] += separator_size + sizes[i]
+                break
+        else:
+            # Items over budget on their own still get a bin - they are never dropped
+            bins.append([i])
+            loads.append(sizes[i])
+    return bins
+
+def pack_captions_batch(images, token_budget=CLIP_TOKEN_BUDGET, count_tokens=None, seed=0):
+    """Pack each image's captions into the fewest ", "-joined rows that fit token_budget (first-fit-decreasing)
+
+    count_tokens maps a list of texts to their token counts (default: estimate_token_counts).
+    Rows and the captions within them are shuffled by per-image random keys, seeded like combine_captions_batch.
+    """
+    if count_tokens is None:
+        count_tokens = estimate_token_counts
+    counts = np.array([len(captions) for _, captions in images], dtype=np.int64)
+    flat = [caption for _, captions in images for caption in captions]
+    token_counts = count_tokens(flat)
+    separator_tokens = count_tokens([SEPARATOR.strip()])[0]
+
+    position = np.arange(len(flat), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    seeds = image_seeds(seed, [image_path for image_path, _ in images])
+    keys = splitmix64(np.repeat(seeds, counts) + position.astype(np.uint64) * GOLDEN_GAMMA).tolist()
+
+    packed = []
+    start = 0
+    for (_, captions), count in zip(images, counts.tolist()):
+        if count <= 1:
+            packed.append(list(captions))
+            start += count
+            continue
+
+        caption_keys = keys[start:start + count]
+        rows = [
+            sorted(row, key=caption_keys.__getitem__)
+            for row in first_fit_decreasing(token_counts[start:start + count], token_budget, separator_tokens)
+        ]
+        rows.sort(key=lambda row: caption_keys[row[0]])
+        packed.append([SEPARATOR.join([captions[i] for i in row]) for row in rows])
+        start += count
+    return packed
+
+def combine_captions(images, mode='words', max_words=20, token_budget=CLIP_TOKEN_BUDGET, tokenizer=None, seed=0):
+    """Combine captions with the chosen COMBINE_MODES strategy; tokenizer names a CLIP tokenizer (None estimates)"""
+    if mode == 'words':
+        return combine_captions_batch(images, max_words, seed)
+    if mode == 'tokens':
+        count_tokens = clip_token_counter(tokenizer) if tokenizer else None
+        return pack_captions_batch(images, token_budget, count_tokens, seed)
+    raise ValueError(f"Unknown combine mode {mode!r}, expected one of {COMBINE_MODES}")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Iterable caption dataset - per-image caption lists held once in compact form, recombined lazily every epoch"""
+
+import argparse
+import os
+from array import array
+
+import numpy as np
+
+from caption_combine import CLIP_TOKEN_BUDGET, combine_captions, splitmix64
+from parse_to_csv import INCLUDE_TASK_4, MAX_WORDS, SPLIT_MODE, SPLIT_SALT, TRAIN_RATIO, VAL_RATIO, ingest_file, split_data
+from path_table import expand_path, intern_path, new_path_table, table_stats
+from split_assign import SPLIT_NAMES, entry_stratum, hash_split_data, stratified_split_data
+
+try:
+    from torch.utils.data import IterableDataset, get_worker_info
+except ImportError:
+    # Without torch the dataset is a plain iterable that runs as a single worker
+    IterableDataset = object
+    get_worker_info = lambda: None
+
+# === CONFIGURATION ===
+DATASET_BATCH_IMAGES = 1024  # Images combined together per batch while iterating
+
+def new_caption_store():
+    """Empty caption store; images get indices 0, 1, 2... in the order they are added"""
+    return {
+        'paths': new_path_table(),
+        'image_ids': array('i'),  # Per image: path ID in 'paths'
+        'caption_starts': array('q', [0]),  # Per image: start of its captions in 'caption_ids' (plus a final end)
+        'caption_ids': array('i'),  # Caption text IDs of all images back to back
+        'texts': [],  # Per caption text ID: the caption string, stored once however often it recurs
+        'text_ids': {}
+    }
+
+def add_image(store, image_path, captions):
+    """Append one image and its captions to a caption store"""
+    store['image_ids'].append(intern_path(store['paths'], image_path))
+    text_ids = store['text_ids']
+    for caption in captions:
+        text_id = text_ids.get(caption)
+        if text_id is None:
+            text_id = text_ids[caption] = len(store['texts'])
+            store['texts'].append(caption)
+        store['caption_ids'].append(text_id)
+    store['caption_starts'].append(len(store['caption_ids']))
+
+def image_count(store):
+    """Number of images in a caption store"""
+    return len(store['image_ids'])
+
+def get_image(store, index):
+    """(image_path, captions) of the image at an index"""
+    texts = store['texts']
+    caption_ids = store['caption_ids'][store['caption_starts'][index]:store['caption_starts'][index + 1]]
+    return expand_path(store['paths'], store['image_ids'][index]), [texts[text_id] for text_id in caption_ids]
+
+def entry_captions(entry_dict, include_task_4=INCLUDE_TASK_4):
+    """Caption list of a passing entry - Task 1, plus Task 4 for damaged vehicles, as parse_to_csv.py builds it"""
+    damage_level = 'N/A'
+    for line in entry_dict.get('Task 3', []):
+        if line.startswith('Damage = '):
+            damage_level = line.split('Damage = ')[1].strip()
+            break
+
+    captions = list(entry_dict.get('Task 1', []))
+    if damage_level != 'N/A' and 'Task 4' in entry_dict and include_task_4:
+        for line in entry_dict['Task 4']:
+            if line.strip() and line.strip().upper() != 'NA':
+                captions.append(line.strip())
+    return captions
+
+def load_caption_stores(input_files, train_ratio=TRAIN_RATIO, val_ratio=VAL_RATIO):
+    """Parse and filter readable files like parse_to_csv.py, returning a caption store per split"""
+    survivors = []
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            print(f"⚠️  {input_file} not found, skipping")
+            continue
+        _, file_survivors, _ = ingest_file((input_file, None))
+        source = input_file.split('/')[-1].split('.')[0]
+        survivors.extend(
+            (entry_dict['image'], entry_captions(entry_dict), entry_stratum(entry_dict, source, entry_dict['image']))
+            for entry_dict in file_survivors
+        )
+
+    if SPLIT_MODE == 'stratified':
+        data_splits = stratified_split_data(survivors, train_ratio, val_ratio, lambda survivor: survivor[2], lambda survivor: survivor[0], SPLIT_SALT)[:3]
+    elif SPLIT_MODE == 'hash':
+        data_splits = hash_split_data(survivors, train_ratio, val_ratio, lambda survivor: survivor[0], SPLIT_SALT)
+    else:
+        data_splits = split_data(survivors, train_ratio, val_ratio)
+
+    stores = {}
+    for split_name, data_split in zip(SPLIT_NAMES, data_splits):
+        store = new_caption_store()
+        for image_path, captions, _ in data_split:
+            add_image(store, image_path, captions)
+        del store['text_ids']  # Only needed by add_image; dropping it keeps the copies sent to workers small
+        stores[split_name] = store
+    return stores
+
+def epoch_seed(seed, epoch):
+    """Combining seed of one epoch, so every epoch draws fresh caption groupings"""
+    return int(splitmix64(np.array([seed % 2 ** 64], dtype=np.uint64) ^ splitmix64(np.array([epoch], dtype=np.uint64)))[0])
+
+def epoch_image_order(store, seed, epoch, shuffle=True):
+    """Image indices in this epoch's visiting order"""
+    if not shuffle:
+        return np.arange(image_count(store))
+    return np.random.default_rng([seed % 2 ** 64, epoch]).permutation(image_count(store))
+
+def iter_epoch_rows(store, epoch, worker_id=0, num_workers=1, seed=0, shuffle=True, combine=True,
+                    combine_mode='words', max_words=MAX_WORDS, token_budget=CLIP_TOKEN_BUDGET, tokenizer=None):
+    """Yield (image_path, caption) rows of one epoch for one worker
+
+    Worker w gets every num_workers-th image of the epoch order, so workers never repeat an image.
+    An image's rows depend only on seed, epoch and the image - not on worker count or batching.
+    """
+    indices = epoch_image_order(store, seed, epoch, shuffle)[worker_id::num_workers].tolist()
+    combine_seed = epoch_seed(seed, epoch)
+    for batch_start in range(0, len(indices), DATASET_BATCH_IMAGES):
+        images = [get_image(store, index) for index in indices[batch_start:batch_start + DATASET_BATCH_IMAGES]]
+        if combine:
+            rows = combine_captions(images, combine_mode, max_words, token_budget, tokenizer, combine_seed)
+        else:
+            rows = [captions for _, captions in images]
+        for (image_path, _), image_rows in zip(images, rows):
+            for caption in image_rows:
+                yield image_path, caption
+
+class CaptionDataset(IterableDataset):
+    """(image_path, caption) rows of a caption store, regrouped every epoch and sharded across DataLoader workers
+
+    Call set_epoch(epoch) before each epoch (in the main process, before workers start) for new groupings.
+    """
+
+    def __init__(self, store, seed=0, shuffle=True, combine=True, combine_mode='words',
+                 max_words=MAX_WORDS, token_budget=CLIP_TOKEN_BUDGET, tokenizer=None):
+        self.store = store
+        self.epoch = 0
+        self.options = {
+            'seed': seed, 'shuffle': shuffle, 'combine': combine, 'combine_mode': combine_mode,
+            'max_words': max_words, 'token_budget': token_budget, 'tokenizer': tokenizer
+        }
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (worker_info.id, worker_info.num_workers) if worker_info else (0, 1)
+        return iter_epoch_rows(self.store, self.epoch, worker_id, num_workers, **self.options)
+
+def main():
+    parser = argparse.ArgumentParser(description='Load readable caption files into caption stores and preview recombined epochs')
+    parser.add_argument('readable_files', nargs='+', help='Readable .txt caption files')
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs to iterate over the train split')
+    parser.add_argument('--workers', type=int, default=1, help='Simulated DataLoader workers')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of image order and caption groupings')
+    parser.add_argument('--mode', choices=('words', 'tokens'), default='words', help='Caption combining mode')
+
+    args = parser.parse_args()
+
+    stores = load_caption_stores(args.readable_files)
+    for split_name, store in stores.items():
+        _, _, table_bytes, _ = table_stats(store['paths'])
+        caption_text_bytes = sum(len(text.encode('utf-8')) for text in store['texts'])
+        print(f"{split_name.upper()}: {image_count(store)} images, {len(store['caption_ids'])} captions "
+              f"({len(store['texts'])} distinct, {(caption_text_bytes + table_bytes) / 1e6:.1f} MB of text)")
+
+    train_store = stores['train']
+    for epoch in range(args.epochs):
+        rows = 0
+        images = set()
+        for worker_id in range(args.workers):
+            for image_path, _ in iter_epoch_rows(train_store, epoch, worker_id, args.workers, args.seed, combine_mode=args.mode):
+                rows += 1
+                images.add(image_path)
+        print(f"Epoch {epoch}: {rows} rows over {len(images)} images from {args.workers} workers")
+
+if __name__ == "__main__":
+    main()
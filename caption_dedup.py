@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Near-duplicate caption removal within each image - MinHash signatures over content words, LSH band buckets"""
+
+import re
+import zlib
+
+import numpy as np
+
+from caption_combine import GOLDEN_GAMMA, splitmix64
+
+# === CONFIGURATION ===
+MINHASH_PERMUTATIONS = 128  # Signature length
+LSH_BANDS = 32  # Bands of MINHASH_PERMUTATIONS // LSH_BANDS rows - two captions become candidates if any band matches
+DEDUP_THRESHOLD = 0.6  # Jaccard similarity of content words at which a candidate caption counts as a near-duplicate
+DEDUP_BATCH_IMAGES = 1024  # Images whose signatures are computed together (memory grows with words x permutations)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'is', 'are', 'was', 'be', 'it', 'its', 'this', 'that', 'there', 'of', 'in', 'on',
+    'at', 'to', 'with', 'and', 'or', 'for', 'from', 'by', 'as', 'has', 'have', 'which', 'appears', 'seems'
+))
+
+MINHASH_SALTS = splitmix64(np.arange(MINHASH_PERMUTATIONS, dtype=np.uint64))
+
+def new_dedup_stats():
+    """Running totals of what dedup_captions_batch has seen and removed"""
+    return {'images': 0, 'captions': 0, 'removed': 0, 'words_removed': 0}
+
+def format_dedup_stats(stats):
+    """One-line summary of a dedup stats dict"""
+    share = stats['removed'] / stats['captions'] * 100 if stats['captions'] else 0.0
+    return (f"Near-duplicate captions removed: {stats['removed']} of {stats['captions']} ({share:.1f}%) "
+            f"across {stats['images']} images, {stats['words_removed']} words")
+
+def caption_shingles(caption, shingle_cache):
+    """Set of hashes of a caption's distinct content words (its whole lowercased text if it has none)"""
+    shingles = shingle_cache.get(caption)
+    if shingles is None:
+        # The same phrases recur across images, so each distinct caption text is split and hashed once
+        text = caption.lower()
+        words = {word for word in WORD_PATTERN.findall(text) if word not in STOPWORDS} or {text.strip()}
+        shingles = shingle_cache[caption] = frozenset(zlib.crc32(word.encode('utf-8')) for word in words)
+    return shingles
+
+def minhash_signatures(shingle_sets):
+    """MinHash signature matrix (captions x MINHASH_PERMUTATIONS) of per-caption shingle hash sets"""
+    lengths = np.array([len(shingles) for shingles in shingle_sets], dtype=np.int64)
+    hashes = np.fromiter((h for shingles in shingle_sets for h in shingles), dtype=np.uint64, count=int(lengths.sum()))
+    # One salted splitmix64 per permutation stands in for a random hash family
+    mixed = splitmix64(hashes[:, None] ^ MINHASH_SALTS[None, :])
+    return np.minimum.reduceat(mixed, np.cumsum(lengths) - lengths, axis=0)
+
+def lsh_band_keys(signatures):
+    """One 64-bit key per (caption, band) of a signature matrix"""
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    bands = signatures[:, :rows * LSH_BANDS].reshape(len(signatures), LSH_BANDS, rows)
+    band_keys = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for row in range(rows):
+        band_keys = splitmix64(band_keys ^ bands[:, :, row])
+    return band_keys
+
+def candidate_pairs(band_keys, owner):
+    """(a, b) caption index lists, a < b, of same-image captions sharing at least one LSH band"""
+    # Bucket = (image, band, band key), folded into one 64-bit key and grouped by sorting
+    band_ids = owner[:, None] * np.uint64(LSH_BANDS) + np.arange(LSH_BANDS, dtype=np.uint64)[None, :]
+    bucket_keys = splitmix64(band_keys ^ splitmix64(band_ids * GOLDEN_GAMMA)).ravel()
+    order = np.argsort(bucket_keys)
+    sorted_keys = bucket_keys[order]
+    captions = order // LSH_BANDS
+
+    run_starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    run_ends = np.append(run_starts[1:], len(sorted_keys))
+    shared = run_ends - run_starts > 1
+    pairs = set()
+    for start, end in zip(run_starts[shared].tolist(), run_ends[shared].tolist()):
+        members = sorted(captions[start:end].tolist())
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pairs.add((a, b))
+    owner = owner.tolist()
+    return [(a, b) for a, b in pairs if owner[a] == owner[b]]
+
+def dedup_batch(images, threshold, shingle_cache):
+    """Keep flag per caption of one batch of (image_path, captions) pairs"""
+    counts = [len(captions) for _, captions in images]
+    flat = [caption for _, captions in images for caption in captions]
+    keep = [True] * len(flat)
+    if len(flat) < 2:
+        return keep
+
+    # Sign each distinct caption text once; repeated texts share its band keys
+    text_ids = {}
+    caption_ids = [text_ids.setdefault(caption, len(text_ids)) for caption in flat]
+    shingle_sets = [caption_shingles(caption, shingle_cache) for caption in text_ids]
+    band_keys = lsh_band_keys(minhash_signatures(shingle_sets))[caption_ids]
+    owner = np.repeat(np.arange(len(images), dtype=np.uint64), counts)
+
+    # Candidates are confirmed on exact Jaccard similarity of their content words
+    beaten_by = {}
+    for a, b in candidate_pairs(band_keys, owner):
+        shingles_a, shingles_b = shingle_sets[caption_ids[a]], shingle_sets[caption_ids[b]]
+        if len(shingles_a & shingles_b) < threshold * len(shingles_a | shingles_b):
+            continue
+        # Of each near-duplicate pair the longer caption wins (the earlier one on ties)
+        winner, loser = (b, a) if len(flat[b]) > len(flat[a]) else (a, b)
+        beaten_by.setdefault(loser, []).append(winner)
+
+    # Visit losers longest first, so every winner's own fate is settled before it is consulted
+    for loser in sorted(beaten_by, key=lambda i: (-len(flat[i]), i)):
+        keep[loser] = not any(keep[winner] for winner in beaten_by[loser])
+    return keep
+
+def dedup_captions_batch(images, threshold=DEDUP_THRESHOLD, stats=None):
+    """Drop near-duplicate captions within each (image_path, captions) pair, keeping caption order
+
+    Work is linear in the corpus: each distinct caption is signed once and only same-image
+    captions sharing an LSH bucket are compared. stats (from new_dedup_stats) is updated in place.
+    """
+    shingle_cache = {}
+    deduped = []
+    for batch_start in range(0, len(images), DEDUP_BATCH_IMAGES):
+        batch = images[batch_start:batch_start + DEDUP_BATCH_IMAGES]
+        keep = iter(dedup_batch(batch, threshold, shingle_cache))
+        for image_path, captions in batch:
+            kept = [caption for caption in captions if next(keep)]
+            deduped.append((image_path, kept))
+            if stats is not None:
+                stats['captions'] += len(captions)
+                if len(kept) < len(captions):
+                    stats['removed'] += len(captions) - len(kept)
+                    stats['words_removed'] += sum(len(caption.split()) for caption in captions) - sum(len(caption.split()) for caption in kept)
+    if stats is not None:
+        stats['images'] += len(images)
+    return deduped
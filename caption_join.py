@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Sort-merge join of any number of caption sources by image path, spilling sorted runs to disk to bound memory"""
+
+import argparse
+import heapq
+import os
+import pickle
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+from parse_to_json import (parse_to_json, check_task5_vehicle_yes, check_task6_visibility_N_plus,
+                           check_task7_visibility_day, check_task8_multiple_no)
+from json_stream import open_json_output
+
+# === CONFIGURATION ===
+JOIN_RUN_SIZE = 200000  # Records sorted in memory before a run is spilled to disk
+SPILL_BATCH_SIZE = 1024  # Records pickled together per record in a run file
+JOIN_MODES = ('inner', 'left', 'outer')
+
+image_key = itemgetter(0)
+
+def write_run(run, spill_dir=None):
+    """Write one sorted run to a temp file and return its path"""
+    fd, path = tempfile.mkstemp(suffix='.run.pkl', dir=spill_dir)
+    with open(fd, 'wb') as f:
+        for start in range(0, len(run), SPILL_BATCH_SIZE):
+            pickle.dump(run[start:start + SPILL_BATCH_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+def read_run(path):
+    """Yield the records of a run file, deleting it once fully read"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def spill_sorted_runs(records, spill_dir=None, run_size=JOIN_RUN_SIZE):
+    """Sort (image_path, value) records in runs of run_size and spill every run to disk, returning the run paths"""
+    run_paths = []
+    run = []
+    try:
+        for record in records:
+            run.append(record)
+            if len(run) >= run_size:
+                run.sort(key=image_key)
+                run_paths.append(write_run(run, spill_dir))
+                run = []
+        if run:
+            run.sort(key=image_key)
+            run_paths.append(write_run(run, spill_dir))
+    except BaseException:
+        for path in run_paths:
+            os.remove(path)
+        raise
+    return run_paths
+
+def merge_sorted_runs(run_paths):
+    """Yield records from spilled runs in image path order - ties keep their original order"""
+    runs = [read_run(path) for path in run_paths]
+    try:
+        yield from heapq.merge(*runs, key=image_key)
+    finally:
+        # Run files that were not fully read are removed when their generator closes
+        for run in runs:
+            run.close()
+        for path in run_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def sort_by_image(records, spill_dir=None, run_size=JOIN_RUN_SIZE):
+    """Yield (image_path, value) records sorted by image path, only spilling to disk past run_size records"""
+    records = iter(records)
+    first_run = []
+    for record in records:
+        first_run.append(record)
+        if len(first_run) >= run_size:
+            break
+    else:
+        first_run.sort(key=image_key)
+        yield from first_run
+        return
+
+    first_run.sort(key=image_key)
+    run_paths = [write_run(first_run, spill_dir)]
+    del first_run
+    run_paths.extend(spill_sorted_runs(records, spill_dir, run_size))
+    yield from merge_sorted_runs(run_paths)
+
+def tag_source(records, source_index):
+    """Attach the source index to each (image_path, value) record"""
+    for image_path, value in records:
+        yield image_path, source_index, value
+
+def join_by_image(sorted_sources, how='inner'):
+    """N-way merge join of image-sorted (image_path, value) streams, yielding (image_path, [values of each source])"""
+    if how not in JOIN_MODES:
+        raise ValueError(f"Unknown join mode {how!r}, expected one of {JOIN_MODES}")
+
+    merged = heapq.merge(*[tag_source(source, i) for i, source in enumerate(sorted_sources)], key=image_key)
+    for image_path, group in groupby(merged, key=image_key):
+        values = [[] for _ in sorted_sources]
+        for _, source_index, value in group:
+            values[source_index].append(value)
+
+        if how == 'inner' and not all(values):
+            continue
+        if how == 'left' and not values[0]:
+            continue
+        yield image_path, values
+
+def join_caption_sources(sources, how='inner', spill_dir=None, run_size=JOIN_RUN_SIZE):
+    """Join unsorted (image_path, captions) sources, yielding (image_path, captions of every source in source order)"""
+    sorted_sources = [sort_by_image(source, spill_dir, run_size) for source in sources]
+    for image_path, values in join_by_image(sorted_sources, how):
+        yield image_path, [caption for source_values in values for captions in source_values for caption in captions]
+
+def append_matching_captions(read_base_records, extra_records):
+    """Stream {'image', 'caption'} base records, extending each image's last one with the captions extra records give it
+
+    read_base_records returns a fresh iterator over the base records, so the base can be read straight from a large file;
+    it is read twice, first to find the last base record of every extra image. Only extra_records (a list) are held in
+    memory. Extra records for images the base never mentions follow at the end one by one, in their own order, exactly
+    as the in-memory merge this replaces appended them.
+    """
+    extra_images = {record['image'] for record in extra_records}
+    base_counts = {}
+    for record in read_base_records():
+        if record['image'] in extra_images:
+            base_counts[record['image']] = base_counts.get(record['image'], 0) + 1
+
+    extra_captions = {}
+    for record in extra_records:
+        if record['image'] in base_counts:
+            extra_captions.setdefault(record['image'], []).extend(record['caption'])
+
+    for record in read_base_records():
+        if record['image'] in base_counts:
+            base_counts[record['image']] -= 1
+            if base_counts[record['image']] == 0:
+                record['caption'].extend(extra_captions[record['image']])
+        yield record
+    for record in extra_records:
+        if record['image'] not in base_counts:
+            yield record
+
+def passing_task_1_captions(filename):
+    """(image_path, Task 1 captions) of every entry passing the Task 5-8 checks of parse_to_json.py"""
+    for entry_dict in parse_to_json(filename):
+        if (check_task5_vehicle_yes(entry_dict) and check_task6_visibility_N_plus(entry_dict)
+                and check_task7_visibility_day(entry_dict) and check_task8_multiple_no(entry_dict)):
+            yield entry_dict['image'], entry_dict.get('Task 1', [])
+
+def main():
+    parser = argparse.ArgumentParser(description='Join the Task 1 captions of several readable caption files by image path')
+    parser.add_argument('readable_files', nargs='+', help='Readable .txt caption files, one per caption model')
+    parser.add_argument('-o', '--output', required=True, help='Output JSON file of {"image", "caption"} items (JSON Lines if it ends in .jsonl)')
+    parser.add_argument('--how', choices=JOIN_MODES, default='inner', help='Keep images found in all files (inner), the first file (left) or any file (outer)')
+    parser.add_argument('--spill-dir', default=None, help='Directory for sorted run files (default: system temp dir)')
+    parser.add_argument('--run-size', type=int, default=JOIN_RUN_SIZE, help='Records sorted in memory per spilled run')
+
+    args = parser.parse_args()
+
+    for filename in args.readable_files:
+        if not os.path.exists(filename):
+            print(f"Error: Input file {filename} not found")
+            return
+
+    sources = [passing_task_1_captions(filename) for filename in args.readable_files]
+    write, close = open_json_output(args.output)
+    for image_path, captions in join_caption_sources(sources, args.how, args.spill_dir, args.run_size):
+        write({'image': image_path, 'caption': captions})
+    print(f"Joined {len(args.readable_files)} sources ({args.how}): {args.output} ({close()} images)")
+
+if __name__ == "__main__":
+    main()
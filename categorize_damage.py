@@ -1,22 +1,18 @@
 import re
 
+from entry_parser import iter_entry_blocks
+
 # === CONFIGURATION ===
 INPUT_FILE = '/home/cynapse/terence/database/blip/results_openai/usroad_filelist_damage_temp0_topk1_topp1_readable.txt'  # Change to your input file
 OUTDIR = '/home/cynapse/terence/database/blip/results_openai/image_check'  # Change to your desired output directory (even if non exist dir)
 IMAGE_BASE_DIR = '/home/cynapse/terence/database/blip/'  # Change to your image base directory
 VISIBILITY = 45
 INCLUDE_NONE_DAMAGE = True  # Set to True to include None damage level, False to exclude itin/env python3
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
 
 def parse_to_dict(filename):
-    results = []
-    
-    with open(filename, 'r') as file:
-        content = file.read()
-    
-    # Split by empty lines to separate different entries
-    entries = content.strip().split('\n\n')
-    
-    for entry_idx, entry in enumerate(entries, 1):
+    # Entries are separated by empty lines and yielded one at a time
+    for entry_idx, entry in enumerate(iter_entry_blocks(filename, READ_BUFFER_SIZE), 1):
         if not entry.strip():
             continue
             
@@ -58,13 +54,11 @@ def parse_to_dict(filename):
         if current_task:
             entry_dict[current_task] = current_content
         
-        results.append(entry_dict)
-        
         # Print the dictionary for this entry
         # print(f"\n=== Entry {entry_idx}: {image_path} ===")
         # print(json.dumps(entry_dict, indent=2))
-    
-    return results
+        
+        yield entry_dict
 
 def check_task5_vehicle_yes(entry_dict):
     if 'Task 5' not in entry_dict:
@@ -147,12 +141,9 @@ def categorize_damage(parsed_entries):
 def main():
     import textwrap
     from PIL import Image, ImageDraw, ImageFont
-    entries = parse_to_dict(INPUT_FILE)
-    
-
-    # Filter entries based on Task 5, 6, 7, and 8 checks
+    # Filter entries based on Task 5, 6, 7, and 8 checks as they are parsed
     filtered_entries = []
-    for entry_dict in entries:
+    for entry_dict in parse_to_dict(INPUT_FILE):
         task5_pass = check_task5_vehicle_yes(entry_dict)
         task6_pass = check_task6_visibility_45_plus(entry_dict)
         task7_pass = check_task7_visibility_day(entry_dict)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Columnar caption outputs - Parquet or Arrow IPC with dictionary-encoded image paths, written and read back by row group"""
+
+import argparse
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# === CONFIGURATION ===
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+COLUMNAR_ROW_GROUP_ROWS = 128 * 1024  # Rows per Parquet row group / Arrow record batch - the unit of parallel reads
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_COMPRESSION_LEVEL = 6
+
+def require_pyarrow():
+    """Raise a clear error when pyarrow is missing"""
+    if pa is None:
+        raise ImportError("Parquet/Arrow output needs the pyarrow package (pip install pyarrow)")
+
+def caption_schema(header):
+    """Arrow schema of (image path, caption) rows, paths dictionary-encoded since every caption row repeats one"""
+    image_key, caption_key = header
+    return pa.schema([(image_key, pa.dictionary(pa.int32(), pa.string())), (caption_key, pa.string())])
+
+def columnar_path(csv_path, columnar_format):
+    """Path of the columnar file that sits next to a CSV output"""
+    for suffix in ('.csv.gz', '.csv'):
+        if csv_path.endswith(suffix):
+            return f"{csv_path[:-len(suffix)]}.{columnar_format}"
+    return f"{csv_path}.{columnar_format}"
+
+def open_columnar_stream(path, header):
+    """Open a .parquet or .arrow file for streaming, returning (write_rows, close) like csv_stream.open_csv_stream
+
+    Parquet row groups are zstd-compressed. Arrow IPC is left uncompressed so readers can memory-map it
+    without copying; its path dictionary grows across batches and is written as deltas.
+    """
+    require_pyarrow()
+    schema = caption_schema(header)
+    if path.endswith('.parquet'):
+        writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION,
+                                  compression_level=PARQUET_COMPRESSION_LEVEL)
+    elif path.endswith('.arrow'):
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+    else:
+        raise ValueError(f"Unsupported columnar output: {path} (expected .parquet or .arrow)")
+
+    pending = []
+    path_ids = {}
+    path_values = []
+    row_count = 0
+
+    def flush():
+        if not pending:
+            return
+        image_paths = [row[0] for row in pending]
+        if path.endswith('.arrow'):
+            # IPC files can't replace a dictionary, only extend it, so keep one growing dictionary
+            indices = []
+            for image_path in image_paths:
+                path_id = path_ids.get(image_path)
+                if path_id is None:
+                    path_id = path_ids[image_path] = len(path_values)
+                    path_values.append(image_path)
+                indices.append(path_id)
+            image_column = pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(path_values, pa.string()))
+        else:
+            # Parquet keeps a dictionary per row group, so each batch only carries its own paths
+            image_column = pa.array(image_paths, pa.string()).dictionary_encode()
+        caption_column = pa.array([row[1] for row in pending], pa.string())
+        writer.write_batch(pa.record_batch([image_column, caption_column], schema=schema))
+        pending.clear()
+
+    def write_rows(rows):
+        nonlocal row_count
+        pending.extend(rows)
+        row_count += len(rows)
+        while len(pending) >= COLUMNAR_ROW_GROUP_ROWS:
+            overflow = pending[COLUMNAR_ROW_GROUP_ROWS:]
+            del pending[COLUMNAR_ROW_GROUP_ROWS:]
+            flush()
+            pending.extend(overflow)
+
+    def close():
+        flush()
+        writer.close()
+        return row_count
+
+    return write_rows, close
+
+def load_caption_table(path):
+    """Read a .parquet/.arrow caption file, or a directory of them, as one Arrow table backed by memory maps"""
+    require_pyarrow()
+    if os.path.isdir(path):
+        parts = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(('.parquet', '.arrow')))
+        return pa.concat_tables([load_caption_table(part) for part in parts])
+    if path.endswith('.arrow'):
+        # Zero-copy: columns point straight into the mapped file
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return pq.read_table(path, memory_map=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a columnar caption output and compare its size with the matching CSV')
+    parser.add_argument('path', help='.parquet or .arrow file, or a directory of them')
+
+    args = parser.parse_args()
+
+    table = load_caption_table(args.path)
+    distinct_paths = len(table.column(0).cast(pa.string()).unique())
+    print(f"{args.path}: {table.num_rows} rows, {distinct_paths} distinct image paths, {table.column(0).num_chunks} row groups")
+    csv_path = args.path.rsplit('.', 1)[0] + '.csv'
+    if os.path.isfile(args.path) and os.path.exists(csv_path):
+        print(f"  {os.path.getsize(args.path) / 1e6:.1f} MB vs {os.path.getsize(csv_path) / 1e6:.1f} MB as CSV")
+
+if __name__ == "__main__":
+    main()
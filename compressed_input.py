@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Read .gz/.zst readable files as text lines, decompressing on a background thread while the caller parses"""
+
+import codecs
+import gzip
+import io
+import locale
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# === CONFIGURATION ===
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+DECOMPRESS_BLOCK_SIZE = 4 * 1024 * 1024  # Decompressed bytes handed from the reader thread per block
+PREFETCH_BLOCKS = 4  # Blocks the reader thread may run ahead of the parser
+PUT_TIMEOUT = 0.1  # Seconds between checks for a parser that stopped reading early
+
+def is_compressed(filename):
+    """True for inputs that have to be decompressed before parsing"""
+    return filename.endswith(COMPRESSED_SUFFIXES)
+
+def open_decompressed(filename):
+    """Open a compressed input as a binary stream of its decompressed bytes"""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError(f"Reading {filename} needs the zstandard package (pip install zstandard)")
+        # Archives written by concatenating zstd runs hold several frames
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True)
+    raise ValueError(f"Unsupported compressed input: {filename}")
+
+def iter_decompressed_blocks(filename):
+    """Yield decompressed blocks produced by a reader thread, so decompression overlaps with parsing"""
+    blocks = queue.Queue(maxsize=PREFETCH_BLOCKS)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_blocks():
+        try:
+            with open_decompressed(filename) as source:
+                for block in iter(lambda: source.read(DECOMPRESS_BLOCK_SIZE), b''):
+                    if not put(block):
+                        return
+            put(None)
+        except Exception as e:
+            # Handed to the parser so a corrupt archive fails loudly instead of looking truncated
+            put(e)
+
+    reader = threading.Thread(target=read_blocks, name=f"decompress-{filename}", daemon=True)
+    reader.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield block
+    finally:
+        stop.set()
+
+def iter_decompressed_lines(filename):
+    """Yield text lines of a compressed input exactly as iterating open(filename, 'r') on the plain file would"""
+    decoder_class = codecs.getincrementaldecoder(locale.getpreferredencoding(False))
+    # Universal newlines, like text-mode open()
+    decoder = io.IncrementalNewlineDecoder(decoder_class(), translate=True)
+    pending = ''
+    for block in iter_decompressed_blocks(filename):
+        lines = (pending + decoder.decode(block)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+def iter_input_lines(filename, buffer_size):
+    """Yield text lines of a readable file, transparently decompressing .gz/.zst inputs"""
+    if is_compressed(filename):
+        yield from iter_decompressed_lines(filename)
+        return
+
+    with open(filename, 'r', buffering=buffer_size) as file:
+        yield from file
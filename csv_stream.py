@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Streaming CSV output - rows buffered into large blocks, encoded, compressed and written on a background thread per file"""
+
+import csv
+import gzip
+import io
+import os
+import queue
+import threading
+
+# === CONFIGURATION ===
+CSV_BLOCK_CHARS = 1024 * 1024  # Buffered CSV text handed to the writer thread per block
+CSV_QUEUE_BLOCKS = 4  # Blocks a writer thread may fall behind before producers wait
+CSV_GZIP_LEVEL = 6  # zlib level for .gz outputs (zlib releases the GIL, so compression overlaps with row generation)
+
+def open_csv_stream(path, header, append=False, delimiter=','):
+    """Open a CSV (gzip-compressed when path ends in .gz) for streaming, returning (write_rows, close) functions
+
+    write_rows takes a list of row tuples; close flushes, waits for the writer thread and returns the rows written.
+    When appending to a non-empty file the header is skipped.
+    """
+    write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+    mode = 'ab' if append else 'wb'
+    f = gzip.open(path, mode, compresslevel=CSV_GZIP_LEVEL) if path.endswith('.gz') else open(path, mode)
+    blocks = queue.Queue(maxsize=CSV_QUEUE_BLOCKS)
+    errors = []
+
+    def drain():
+        try:
+            with f:
+                while True:
+                    block = blocks.get()
+                    if block is None:
+                        return
+                    f.write(block.encode('utf-8'))
+        except BaseException as e:
+            errors.append(e)
+            # Keep taking blocks so a producer never waits on a dead writer
+            while blocks.get() is not None:
+                pass
+
+    thread = threading.Thread(target=drain, name=f"csv-writer-{os.path.basename(path)}", daemon=True)
+    thread.start()
+
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer, delimiter=delimiter)
+    row_count = 0
+    if write_header:
+        writer.writerow(header)
+
+    def flush():
+        if buffer.tell():
+            blocks.put(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+    def write_rows(rows):
+        nonlocal row_count
+        if errors:
+            raise errors[0]
+        writer.writerows(rows)
+        row_count += len(rows)
+        if buffer.tell() >= CSV_BLOCK_CHARS:
+            flush()
+
+    def close():
+        flush()
+        blocks.put(None)
+        thread.join()
+        if errors:
+            raise errors[0]
+        return row_count
+
+    return write_rows, close
+
+def write_interleaved(outputs):
+    """Feed (row batch iterator, [write_rows functions]) pairs in turn until all are exhausted
+
+    Taking one batch from each in rotation keeps every output's writer thread busy at the same time,
+    and only one batch per output is held in memory.
+    """
+    active = [(iter(batches), writes) for batches, writes in outputs]
+    while active:
+        still_active = []
+        for batches, writes in active:
+            batch = next(batches, None)
+            if batch is None:
+                continue
+            for write_rows in writes:
+                write_rows(batch)
+            still_active.append((batches, writes))
+        active = still_active
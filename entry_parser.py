@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Readable caption file parsing - entry blocks, compiled tag filtering and parallel byte-range parsing for every parse script"""
+
+import io
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from compressed_input import is_compressed, iter_input_lines
+
+# === CONFIGURATION ===
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024  # Target size of each byte range handed to a parse worker
+
+TAG_PATTERN = re.compile(r'(\[.*?\])')
+TAG_STRIP_PATTERN = re.compile(r'\[.*?\]\s*')
+
+def build_tag_filter(include_tags, include_all_tags, debug=False):
+    """Compile the tag configuration into a single-pass line filter - only keeps content from enabled tags"""
+    tag_bits = {tag: 1 << i for i, tag in enumerate(include_tags)}
+    enabled_mask = 0
+    for tag, include in include_tags.items():
+        if include:
+            enabled_mask |= tag_bits[tag]
+    split_tags = TAG_PATTERN.split
+
+    def filter_line(line):
+        # Untagged lines (Tasks 3-8) never reach the regex
+        if '[' not in line:
+            return line.strip()
+
+        if include_all_tags:
+            return TAG_STRIP_PATTERN.sub('', line).strip()
+
+        # One split gives text / tag / text / tag ..., so tags sit at odd indices
+        parts = split_tags(line)
+        if len(parts) == 1:
+            return line.strip()
+
+        if debug:
+            print(f"Original: {line} | Tags: {parts[1::2]}")
+
+        result_parts = []
+        for i in range(1, len(parts), 2):
+            if tag_bits.get(parts[i], 0) & enabled_mask:
+                content = parts[i + 1].strip()
+                if content:
+                    result_parts.append(content)
+
+        result = ' '.join(result_parts)
+        if debug:
+            print(f"Filtered result: {result}")
+        return result
+
+    return filter_line
+
+def split_entry_blocks(lines):
+    """Group lines into blank-line separated entry blocks"""
+    block = []
+    for line in lines:
+        if line == '\n':
+            if block:
+                yield ''.join(block)
+                block = []
+        else:
+            block.append(line)
+    if block:
+        yield ''.join(block)
+
+def iter_entry_blocks(filename, read_buffer_size=READ_BUFFER_SIZE):
+    """Stream blank-line separated entries from the input file (plain, .gz or .zst) without reading it whole"""
+    yield from split_entry_blocks(iter_input_lines(filename, read_buffer_size))
+
+def parse_entry(entry, filter_line):
+    """Parse one entry block into a dict of tag-filtered task lines, or None if it is not an image entry"""
+    if not entry.strip():
+        return None
+
+    lines = entry.strip().split('\n')
+    if not lines or ':' not in lines[0]:
+        return None
+
+    image_path = lines[0].split(':')[0].strip()
+    entry_dict = {"image": image_path}
+
+    current_task = None
+    current_content = []
+
+    for line in lines[1:]:
+        line = line.strip()
+        if line.startswith('Task '):
+            if current_task:
+                entry_dict[current_task] = current_content
+            current_task = line
+            current_content = []
+        elif line:
+            cleaned_line = filter_line(line)
+            if cleaned_line:
+                current_content.append(cleaned_line)
+
+    if current_task:
+        entry_dict[current_task] = current_content
+
+    return entry_dict
+
+def parse_entry_lazy(entry):
+    """Split one entry block into per-task line spans without tag-filtering any content yet"""
+    if not entry.strip():
+        return None
+
+    lines = entry.strip().split('\n')
+    if not lines or ':' not in lines[0]:
+        return None
+
+    # Same task header rules as parse_entry - a repeated header keeps its first position but its last content
+    spans = {}
+    current_task = None
+    start = 0
+    for i in range(1, len(lines)):
+        line = lines[i].strip()
+        if line.startswith('Task '):
+            if current_task:
+                spans[current_task] = (start, i)
+            current_task = line
+            start = i + 1
+
+    if current_task:
+        spans[current_task] = (start, len(lines))
+
+    return {'image': lines[0].split(':')[0].strip(), 'lines': lines, 'spans': spans}
+
+def materialize_lazy_entry(lazy_entry, filter_line, tasks=None):
+    """Tag-filter the requested tasks of a lazy entry (all when tasks is None) into a parse_entry style dict"""
+    lines = lazy_entry['lines']
+    entry_dict = {"image": lazy_entry['image']}
+    for task, (start, end) in lazy_entry['spans'].items():
+        if tasks is not None and task not in tasks:
+            continue
+        content = []
+        for line in lines[start:end]:
+            line = line.strip()
+            if line:
+                cleaned_line = filter_line(line)
+                if cleaned_line:
+                    content.append(cleaned_line)
+        entry_dict[task] = content
+    return entry_dict
+
+def find_chunk_ranges(filename, num_chunks):
+    """Cut the file into byte ranges that each start right after a blank-line separator"""
+    file_size = os.path.getsize(filename)
+    if file_size == 0:
+        return []
+
+    boundaries = [0]
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(1, num_chunks):
+            target = max(file_size * i // num_chunks, boundaries[-1])
+            separator_pos = mm.find(b'\n\n', target)
+            if separator_pos == -1:
+                break
+            boundaries.append(separator_pos + 2)
+    boundaries.append(file_size)
+
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def parse_chunk(chunk):
+    """Parse one byte range of the input file - runs inside a worker process, which compiles its own tag filter"""
+    filename, start, end, tag_config, lazy = chunk
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = io.TextIOWrapper(io.BytesIO(mm[start:end]))
+
+    filter_line = build_tag_filter(*tag_config)
+    results = []
+    for entry in split_entry_blocks(text):
+        entry_dict = parse_entry_lazy(entry) if lazy else parse_entry(entry, filter_line)
+        if entry_dict is not None:
+            results.append(entry_dict)
+    return results
+
+def parse_entries_parallel(filename, tag_config, workers, chunk_bytes=PARSE_CHUNK_BYTES, lazy=False):
+    """Parse input file across a process pool, yielding entries in original file order"""
+    file_size = os.path.getsize(filename)
+    num_chunks = max(workers, -(-file_size // chunk_bytes))
+    chunks = [(filename, start, end, tag_config, lazy) for start, end in find_chunk_ranges(filename, num_chunks)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a couple of chunks per worker in flight so parsed results never pile up ahead of the consumer
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(parse_chunk, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.pop(0).result()
+        while in_flight:
+            yield from in_flight.pop(0).result()
+
+def parse_entries(filename, tag_config, workers=1, read_buffer_size=READ_BUFFER_SIZE, chunk_bytes=PARSE_CHUNK_BYTES, lazy=False):
+    """Yield the entries of a readable file one at a time - parse_entry dicts, or parse_entry_lazy ones when lazy is set
+
+    tag_config is the (include_tags, include_all_tags, debug) triple passed to build_tag_filter. With workers above 1,
+    uncompressed files are parsed in byte ranges across a process pool (.gz/.zst inputs always use one process).
+    """
+    if workers > 1 and not is_compressed(filename):
+        yield from parse_entries_parallel(filename, tag_config, workers, chunk_bytes, lazy)
+        return
+
+    filter_line = build_tag_filter(*tag_config)
+    for entry in iter_entry_blocks(filename, read_buffer_size):
+        entry_dict = parse_entry_lazy(entry) if lazy else parse_entry(entry, filter_line)
+        if entry_dict is not None:
+            yield entry_dict
@@ -8,6 +8,7 @@
 IMAGE_PATH="/usroad/ALPR MD-210 NB Livingston Rd/ALPR MD-210 NB Livingston Rd 5-19-2025 10.25.59 EDT - 5-19-2025 11.25.59 EDT_frame0187_det252_0265px_vehicle_0p856.png"
 IMAGE_BASE_DIR="/home/cynapse/terence/database/blip/"
 OUTPUT_DIR="/home/cynapse/zhenyang/caption_parser/"
+READABLE_FILE=""  # Optional *_readable.txt - if set, the image's captions are printed via image_index.py
 
 # ========================
 # Example Usage
@@ -28,3 +29,8 @@ cp "$FULL_IMAGE_PATH" "$OUTPUT_DIR/"
 echo "Copied:"
 echo "  From: $FULL_IMAGE_PATH"
 echo "  To:   $OUTPUT_DIR"
+
+# Print the image's captions, seeking straight to its record
+if [ -n "$READABLE_FILE" ]; then
+    python3 "$(dirname "$0")/image_index.py" "$READABLE_FILE" "${IMAGE_PATH#/}"
+fi
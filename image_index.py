@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Sidecar index from image path to byte offset/length of its record in a readable .txt file"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# === CONFIGURATION ===
+INDEX_SUFFIX = '.imgidx.npy'
+META_SUFFIX = '.imgidx.json'
+READ_BUFFER_SIZE = 1024 * 1024
+INDEX_DTYPE = np.dtype([('hash', '<u8'), ('offset', '<u8'), ('length', '<u4')])
+
+def path_hash(image_path):
+    """Stable 64-bit hash of an image path"""
+    return int.from_bytes(hashlib.blake2b(image_path.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def record_image_path(record):
+    """Image path of a raw record, or None if it is not an image entry (same rule as parse_entry)"""
+    first_line = record.strip().split('\n')[0]
+    if ':' not in first_line:
+        return None
+    return first_line.split(':')[0].strip()
+
+def iter_record_spans(filename):
+    """Yield (offset, length, image_path) for every record, streaming the file once in binary mode"""
+    offset = 0
+    block_start = None
+    block = []
+    with open(filename, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        for line in f:
+            if line in (b'\n', b'\r\n'):
+                if block:
+                    image_path = record_image_path(b''.join(block).decode('utf-8'))
+                    if image_path is not None:
+                        yield block_start, offset - block_start, image_path
+                    block = []
+            else:
+                if not block:
+                    block_start = offset
+                block.append(line)
+            offset += len(line)
+    if block:
+        image_path = record_image_path(b''.join(block).decode('utf-8'))
+        if image_path is not None:
+            yield block_start, offset - block_start, image_path
+
+def source_fingerprint(filename):
+    """Size and mtime of the readable file, used to detect a stale index"""
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def build_image_index(filename):
+    """Build and save the sidecar index for a readable file, returning the index array"""
+    hashes = []
+    offsets = []
+    lengths = []
+    for offset, length, image_path in iter_record_spans(filename):
+        hashes.append(path_hash(image_path))
+        offsets.append(offset)
+        lengths.append(length)
+
+    index = np.empty(len(hashes), dtype=INDEX_DTYPE)
+    index['hash'] = hashes
+    index['offset'] = offsets
+    index['length'] = lengths
+    # Stable sort keeps duplicate images in file order
+    index = index[np.argsort(index['hash'], kind='stable')]
+
+    np.save(filename + INDEX_SUFFIX, index)
+    with open(filename + META_SUFFIX, 'w') as f:
+        json.dump({**source_fingerprint(filename), 'records': len(index)}, f)
+    return index
+
+def load_image_index(filename, rebuild_stale=True):
+    """Memory-map the sidecar index, (re)building it if missing or older than the readable file"""
+    meta_path = filename + META_SUFFIX
+    index_path = filename + INDEX_SUFFIX
+    if os.path.exists(meta_path) and os.path.exists(index_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta['size'] == os.path.getsize(filename) and meta['mtime_ns'] == os.stat(filename).st_mtime_ns:
+            return np.load(index_path, mmap_mode='r')
+        if not rebuild_stale:
+            raise ValueError(f"Image index for {filename} is stale")
+    print(f"Building image index for {filename}...")
+    return build_image_index(filename)
+
+def lookup_records(filename, image_paths, index=None):
+    """Yield (image_path, raw record text) for each requested image, reading only those records"""
+    if index is None:
+        index = load_image_index(filename)
+    hashes = index['hash']
+
+    with open(filename, 'rb') as f:
+        for image_path in image_paths:
+            h = np.uint64(path_hash(image_path))
+            start = np.searchsorted(hashes, h, side='left')
+            end = np.searchsorted(hashes, h, side='right')
+            for i in range(start, end):
+                f.seek(int(index['offset'][i]))
+                record = f.read(int(index['length'][i])).decode('utf-8')
+                # Different paths can share a 64-bit hash, so confirm before returning
+                if record_image_path(record) == image_path:
+                    yield image_path, record
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the image path -> record offset index of a readable .txt file')
+    parser.add_argument('readable_file', help='Path to the *_readable.txt caption file')
+    parser.add_argument('image_paths', nargs='*', help='Image paths to look up (omit to only build the index)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index even if it is up to date')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.readable_file):
+        print(f"Error: Input file {args.readable_file} not found")
+        return
+
+    if args.rebuild:
+        index = build_image_index(args.readable_file)
+    else:
+        index = load_image_index(args.readable_file)
+    print(f"Index: {args.readable_file + INDEX_SUFFIX} ({len(index)} records)")
+
+    found = set()
+    for image_path, record in lookup_records(args.readable_file, args.image_paths, index):
+        found.add(image_path)
+        print(record.strip())
+        print()
+    for image_path in args.image_paths:
+        if image_path not in found:
+            print(f"Missing: {image_path}")
+
+if __name__ == "__main__":
+    main()
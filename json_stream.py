@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Streaming JSON output - indented JSON arrays or JSON Lines, written record by record as they are produced"""
+
+import json
+import textwrap
+
+# === CONFIGURATION ===
+JSON_OUTPUT_FORMATS = ('json', 'jsonl')  # 'json': one indented array, as json.dump(indent=2) writes it; 'jsonl': one record per line
+
+def open_json_array(path):
+    """Write a JSON array item by item, laid out exactly like json.dump(items, f, indent=2)"""
+    f = open(path, 'w')
+    count = 0
+
+    def write(item):
+        nonlocal count
+        f.write('[\n' if count == 0 else ',\n')
+        f.write(textwrap.indent(json.dumps(item, indent=2), '  '))
+        count += 1
+
+    def close():
+        f.write('[]' if count == 0 else '\n]')
+        f.close()
+        return count
+
+    return write, close
+
+def open_json_lines(path):
+    """Write JSON Lines - one compact record per line, so readers can stream the file back without loading it"""
+    f = open(path, 'w')
+    count = 0
+
+    def write(item):
+        nonlocal count
+        f.write(json.dumps(item))
+        f.write('\n')
+        count += 1
+
+    def close():
+        f.close()
+        return count
+
+    return write, close
+
+def open_json_output(path):
+    """Open a .jsonl path as JSON Lines and anything else as an indented JSON array, returning (write, close)"""
+    if path.endswith('.jsonl'):
+        return open_json_lines(path)
+    return open_json_array(path)
+
+def iter_json_records(path):
+    """Yield the records of a JSON Lines file one line at a time, or of a JSON array file (which has to be loaded whole)"""
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, 'r') as f:
+            yield from json.load(f)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Disk cache of parsed readable.txt entries, keyed by input file fingerprint and tag config"""
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+# === CONFIGURATION ===
+CACHE_FORMAT_VERSION = 1
+CACHE_BATCH_SIZE = 1024  # Entries pickled together per record in the cache file
+CACHE_COMPRESS_LEVEL = 1  # gzip level - cache reads are dominated by decompression, so keep it fast
+HASH_BLOCK_SIZE = 1024 * 1024
+CACHE_SUFFIX = '.entries.pkl.gz'
+
+def file_fingerprint(filename, hash_content=False):
+    """Identify an input file by path, size and mtime, plus a content hash if requested"""
+    stat = os.stat(filename)
+    fingerprint = {
+        'path': os.path.abspath(filename),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+    if hash_content:
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        # Content hash replaces mtime so a touched but unchanged file still hits
+        del fingerprint['mtime_ns']
+        fingerprint['sha1'] = digest.hexdigest()
+    return fingerprint
+
+def cache_path(cache_dir, filename, tag_config, hash_content=False):
+    """Build the cache file path for an input file under a given tag filter config"""
+    key = json.dumps({
+        'version': CACHE_FORMAT_VERSION,
+        'file': file_fingerprint(filename, hash_content),
+        'tags': tag_config
+    }, sort_keys=True)
+    key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    input_base = os.path.basename(filename).split('.')[0]
+    return os.path.join(cache_dir, f"{input_base}_{key_hash[:16]}{CACHE_SUFFIX}")
+
+def read_cache(path):
+    """Yield entries from a cache file batch by batch"""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+def evict_cache(cache_dir, max_bytes, keep=None):
+    """Delete least recently used cache files until the directory fits within max_bytes"""
+    cache_files = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(CACHE_SUFFIX):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            cache_files.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes = sum(size for _, size, _ in cache_files)
+    for _, size, path in sorted(cache_files):
+        if total_bytes <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total_bytes -= size
+        print(f"  Evicted parse cache: {path}")
+
+def cached_parse(filename, parse_func, cache_dir, tag_config, max_bytes, hash_content=False):
+    """Yield parsed entries from the cache, or parse the file with parse_func and cache the result"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, filename, tag_config, hash_content)
+
+    if os.path.exists(path):
+        print(f"  Loading parsed entries from cache: {path}")
+        # Touch on hit so eviction drops the least recently used files first
+        os.utime(path)
+        yield from read_cache(path)
+        return
+
+    # Write to a temp file and rename on success so an interrupted run never leaves a partial cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    completed = False
+    try:
+        with gzip.open(tmp_path, 'wb', compresslevel=CACHE_COMPRESS_LEVEL) as f:
+            batch = []
+            for entry_dict in parse_func(filename):
+                batch.append(entry_dict)
+                if len(batch) >= CACHE_BATCH_SIZE:
+                    # Pickle before handing entries on, so callers can't change what gets cached
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield from batch
+                    batch = []
+            if batch:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield from batch
+        completed = True
+    finally:
+        if completed:
+            os.replace(tmp_path, path)
+            print(f"  Stored parsed entries in cache: {path}")
+            evict_cache(cache_dir, max_bytes, keep=path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def main():
+    cache_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
+    if not os.path.isdir(cache_dir):
+        print(f"Error: Cache directory {cache_dir} not found")
+        return
+
+    total_bytes = 0
+    for name in sorted(os.listdir(cache_dir)):
+        if name.endswith(CACHE_SUFFIX):
+            size = os.path.getsize(os.path.join(cache_dir, name))
+            total_bytes += size
+            print(f"{name}: {size / 1e6:.1f} MB")
+    print(f"Total: {total_bytes / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,20 @@
 """Parse caption data and output to CSV format with multiple entries per image"""
 
 import json
-import re
-import csv
+import hashlib
 import os
 import random
+from concurrent.futures import ProcessPoolExecutor
+
+from caption_combine import combine_captions
+from caption_dedup import dedup_captions_batch, format_dedup_stats, new_dedup_stats
+from columnar_output import columnar_path, open_columnar_stream
+from compressed_input import is_compressed
+from csv_stream import open_csv_stream, write_interleaved
+from entry_parser import build_tag_filter, parse_entries, parse_entry
+from path_table import expand_path, intern_path, new_path_table, table_stats
+from split_assign import SPLIT_NAMES, add_stratified, entry_stratum, finish_stratified, format_stratum_report, hash_split_data, new_stratified_splitter
+from webdataset_shards import format_shard_report, open_shard_stream
 
 # === CONFIGURATION ===
 INPUT_FILES = [
@@ -17,16 +27,40 @@ INPUT_FILES = [
 OUTPUT_DIR = '/home/cynapse/zhenyang/caption_parser/output_csv/'
 # OUTPUT_DIR = '/home/cynapse/terence/open_clip/data'
 VISIBILITY_THRESHOLD = 50
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
+PARSE_WORKERS = 1  # Set above 1 to parse large input files across a process pool (.gz/.zst inputs always use one)
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024  # Target size of each byte range handed to a parse worker
+INGEST_WORKERS = 1  # Set above 1 to parse and filter the INPUT_FILES concurrently, one worker process per file
+SURVIVOR_KEYS = ('image', 'Task 1', 'Task 3', 'Task 4')  # Entry fields a worker sends back for each passing entry
 OUTPUT_SUFFIX = 'combined_blip_caption_csv'
 MAX_WORDS = 30
 COMBINE_CAPTIONS = True
+COMBINE_SEED = 0  # Seed of the per-image caption shuffle - same seed and image give the same combined captions
+COMBINE_MODE = 'words'  # 'words': even groups of about MAX_WORDS words; 'tokens': fewest rows that each fit TOKEN_BUDGET
+TOKEN_BUDGET = 75  # CLIP text tokens per combined caption (77-token context minus start/end tokens)
+CAPTION_TOKENIZER = None  # None estimates token counts; a Hugging Face CLIP tokenizer name (needs transformers) counts exactly
+DEDUP_CAPTIONS = False  # Drop near-duplicate captions within each image (MinHash/LSH) before combining
+DEDUP_THRESHOLD = 0.6  # Jaccard similarity of two captions' content words at which the shorter one is dropped
 TRAIN_RATIO = 0.8
 VAL_RATIO = 0.2
+SPLIT_MODE = 'hash'  # 'hash': each image's split follows a stable hash of its path (same on re-runs and appends); 'stratified': exact ratios per (damage, source, camera folder), small folders pooled per (damage, source); 'random': reshuffle every run
+SPLIT_SALT = ''  # Change to draw a different, but again stable, hash split
 
 # === CSV FORMAT OPTIONS ===
 CSV_IMG_KEY = 'image_path'
 CSV_CAPTION_KEY = 'caption'
 CSV_SEPARATOR = ','  # Use ',' for CSV or '\t' for TSV
+CSV_COMPRESS = False  # Write .csv.gz splits, gzip-compressed on the writer threads
+CSV_BATCH_IMAGES = 4096  # Images whose rows are generated and handed to the writers at a time
+COLUMNAR_OUTPUT = None  # 'parquet' or 'arrow' (Arrow IPC) to also write each split next to its CSV, for memory-mapped loading
+WEBDATASET_SHARDS = False  # Also pack each split's images and captions into WebDataset tar shards, for sequential reads when training
+IMAGE_BASE_DIR = '/home/cynapse/terence/database/blip/'  # Image paths are relative to this when packing shards
+
+# === INCREMENTAL MODE ===
+# Only parse records appended since the last run and append their rows to the existing split CSVs.
+# A record counts as complete once a blank line follows it, so the record still being written is left for the next run.
+INCREMENTAL_MODE = False
+CHECKPOINT_FILE = os.path.join(OUTPUT_DIR, f"{OUTPUT_SUFFIX}_checkpoint.json")
 
 # === TAG FILTERING ===
 INCLUDE_TAGS = {
@@ -43,85 +77,73 @@ INCLUDE_ALL_TAGS = False
 INCLUDE_TASK_4 = False
 DEBUG_TAG_FILTERING = False
 
-def filter_tags(line):
-    """Filter content based on tag configuration - only keeps content from enabled tags"""
-    if not line:
-        return line.strip()
-    
-    if INCLUDE_ALL_TAGS:
-        return re.sub(r'\[.*?\]\s*', '', line).strip()
-    
-    tags = re.findall(r'\[.*?\]', line)
-    if not tags:
-        return line.strip()
-    
-    if DEBUG_TAG_FILTERING:
-        print(f"Original: {line} | Tags: {tags}")
-    
-    has_enabled_tag = any(tag in INCLUDE_TAGS and INCLUDE_TAGS[tag] for tag in tags)
-    if not has_enabled_tag:
-        return ''
-    
-    result_parts = []
-    parts = re.split(r'(\[.*?\])', line)
-    
-    for i, part in enumerate(parts):
-        if part.startswith('[') and part.endswith(']'):
-            tag = part
-            if tag in INCLUDE_TAGS and INCLUDE_TAGS[tag]:
-                if i + 1 < len(parts):
-                    content = parts[i + 1].strip()
-                    if content:
-                        result_parts.append(content)
-    
-    result = ' '.join(result_parts).strip()
-    
-    if DEBUG_TAG_FILTERING:
-        print(f"Filtered result: {result}")
-    
-    return result
+# Built once from the config above - call build_tag_filter again if the tag config changes at runtime
+filter_tags = build_tag_filter(INCLUDE_TAGS, INCLUDE_ALL_TAGS, DEBUG_TAG_FILTERING)
 
 def parse_to_json(filename):
-    """Parse input file and return structured data"""
-    results = []
-    
-    with open(filename, 'r') as file:
-        content = file.read()
-    
-    entries = content.strip().split('\n\n')
-    
-    for entry in entries:
-        if not entry.strip():
-            continue
-            
-        lines = entry.strip().split('\n')
-        if not lines or ':' not in lines[0]:
-            continue
-            
-        image_path = lines[0].split(':')[0].strip()
-        entry_dict = {"image": image_path}
-        
-        current_task = None
-        current_content = []
-        
-        for line in lines[1:]:
-            line = line.strip()
-            if line.startswith('Task '):
-                if current_task:
-                    entry_dict[current_task] = current_content
-                current_task = line
-                current_content = []
-            elif line:
-                cleaned_line = filter_tags(line)
-                if cleaned_line:
-                    current_content.append(cleaned_line)
-        
-        if current_task:
-            entry_dict[current_task] = current_content
-        
-        results.append(entry_dict)
+    """Parse input file and yield structured data one entry at a time"""
+    return parse_entries(filename, (INCLUDE_TAGS, INCLUDE_ALL_TAGS, DEBUG_TAG_FILTERING),
+                         PARSE_WORKERS, READ_BUFFER_SIZE, PARSE_CHUNK_BYTES)
+
+def new_checkpoint():
+    """Checkpoint for a file that has not been read yet"""
+    return {'offset': 0, 'record_offset': 0, 'record_length': 0, 'record_sha1': None}
+
+def checkpoint_is_valid(filename, checkpoint):
+    """Check the file still holds the last checkpointed record in place, i.e. it has only been appended to"""
+    if not os.path.exists(filename) or os.path.getsize(filename) < checkpoint['offset']:
+        return False
+    if checkpoint['record_sha1'] is None:
+        return True
     
-    return results
+    with open(filename, 'rb') as f:
+        f.seek(checkpoint['record_offset'])
+        record = f.read(checkpoint['record_length'])
+    return hashlib.sha1(record).hexdigest() == checkpoint['record_sha1']
+
+def load_checkpoints():
+    """Load per-file checkpoints, returning ({}, False) when outputs have to be rebuilt from scratch"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        print(f"No checkpoint found, parsing all input from the start")
+        return {}, False
+    
+    with open(CHECKPOINT_FILE, 'r') as f:
+        checkpoints = json.load(f)
+    
+    for input_file, checkpoint in checkpoints.items():
+        if input_file in INPUT_FILES and not checkpoint_is_valid(input_file, checkpoint):
+            print(f"⚠️  {input_file} changed since the last checkpoint, rebuilding all outputs")
+            return {}, False
+    return checkpoints, True
+
+def parse_appended_entries(filename, checkpoint):
+    """Yield entries from complete records after checkpoint['offset'], advancing the checkpoint past each one"""
+    offset = checkpoint['offset']
+    block_start = offset
+    block = []
+    with open(filename, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            if line in (b'\n', b'\r\n'):
+                if block:
+                    record = b''.join(block)
+                    checkpoint.update({
+                        'offset': offset,
+                        'record_offset': block_start,
+                        'record_length': len(record),
+                        'record_sha1': hashlib.sha1(record).hexdigest()
+                    })
+                    block = []
+                    entry_dict = parse_entry(record.decode('utf-8'), filter_tags)
+                    if entry_dict is not None:
+                        yield entry_dict
+                else:
+                    checkpoint['offset'] = offset
+            else:
+                if not block:
+                    block_start = offset - len(line)
+                block.append(line)
 
 def check_task5_vehicle_yes(entry_dict):
     """Check if Task 5 contains 'Vehicle: Yes'"""
@@ -154,6 +176,33 @@ def check_task8_multiple_no(entry_dict):
         return False
     return any(line.strip() == 'Multiple = no' for line in entry_dict['Task 8'])
 
+def passes_task_checks(entry_dict):
+    """Task 5, 6, 7 and 8 checks every training entry has to pass"""
+    return all([
+        check_task5_vehicle_yes(entry_dict),
+        check_task6_visibility_N_plus(entry_dict),
+        check_task7_visibility_day(entry_dict),
+        check_task8_multiple_no(entry_dict)
+    ])
+
+def ingest_file(job):
+    """Parse and filter one input file, returning (entry count, passing entries, advanced checkpoint)"""
+    input_file, checkpoint = job
+    if checkpoint is not None:
+        entries = parse_appended_entries(input_file, checkpoint)
+    else:
+        entries = parse_to_json(input_file)
+    
+    file_count = 0
+    survivors = []
+    for entry_dict in entries:
+        file_count += 1
+        if passes_task_checks(entry_dict):
+            # Only the fields prepare_csv_data reads are kept, so less is pickled back from a worker
+            survivors.append({key: entry_dict[key] for key in SURVIVOR_KEYS if key in entry_dict})
+    # Rejected entries are dropped here, so only survivors travel back from an ingest worker
+    return file_count, survivors, checkpoint
+
 def generate_combined_captions(captions, max_words=20):
     """Combine captions using the specified strategy"""
     if len(captions) <= 1:
@@ -223,113 +272,177 @@ def main():
     print(f"\nINCLUDE_ALL_TAGS: {INCLUDE_ALL_TAGS}")
     print("\n" + "="*50 + "\n")
     
-    all_results = []
+    checkpoints = {}
+    append_outputs = False
+    if INCREMENTAL_MODE:
+        checkpoints, append_outputs = load_checkpoints()
+    
+    total_count = 0
+    filtered_results = []
+    path_table = new_path_table()  # Passing entries carry integer path IDs until rows are written
+    splitter = new_stratified_splitter(TRAIN_RATIO, VAL_RATIO, SPLIT_SALT)  # Queued as files are read when SPLIT_MODE is 'stratified'
+    
+    print(f"=== FILTERING BY TASK 5, 6, 7, AND 8 ===")
+    
+    found_files = [input_file for input_file in INPUT_FILES if os.path.exists(input_file)]
+    jobs = []
+    for input_file in found_files:
+        if INCREMENTAL_MODE and is_compressed(input_file):
+            # Checkpoints are byte offsets into the plain file, which a compressed archive doesn't have
+            raise ValueError(f"INCREMENTAL_MODE can't resume inside compressed input {input_file} - decompress it first")
+        checkpoint = checkpoints.setdefault(input_file, new_checkpoint()) if INCREMENTAL_MODE else None
+        jobs.append((input_file, checkpoint))
+    
+    # Each file is parsed and filtered in its own worker; map() keeps results in INPUT_FILES order
+    if INGEST_WORKERS > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(INGEST_WORKERS, len(jobs))) as pool:
+            results = list(pool.map(ingest_file, jobs))
+    else:
+        results = map(ingest_file, jobs)
+    results = iter(results)
     
-    # Process each input file
     for input_file in INPUT_FILES:
         print(f"Parsing {input_file}...")
-        if os.path.exists(input_file):
-            file_results = parse_to_json(input_file)
-            all_results.extend(file_results)
-            print(f"  Added {len(file_results)} entries")
+        if input_file in found_files:
+            if INCREMENTAL_MODE:
+                print(f"  Resuming from byte {checkpoints[input_file]['offset']}")
+            file_count, survivors, checkpoint = next(results)
+            if INCREMENTAL_MODE:
+                checkpoints[input_file] = checkpoint
+            source = input_file.split('/')[-1].split('.')[0]
+            for entry_dict in survivors:
+                if SPLIT_MODE == 'stratified':
+                    add_stratified(splitter, entry_stratum(entry_dict, source, entry_dict['image']), entry_dict['image'], entry_dict)
+                entry_dict['image'] = intern_path(path_table, entry_dict['image'])
+            filtered_results.extend(survivors)
+            total_count += file_count
+            print(f"  Added {file_count} entries")
         else:
             print(f"  ⚠️  File not found, skipping")
     
-    filtered_results = []
-    
-    print(f"\n=== FILTERING BY TASK 5, 6, 7, AND 8 ===")
-    
-    for i, entry_dict in enumerate(all_results, 1):
-        task5_pass = check_task5_vehicle_yes(entry_dict)
-        task6_pass = check_task6_visibility_N_plus(entry_dict)
-        task7_pass = check_task7_visibility_day(entry_dict)
-        task8_pass = check_task8_multiple_no(entry_dict)
-        
-        overall_pass = all([task5_pass, task6_pass, task7_pass, task8_pass])
-        
-        if overall_pass:
-            filtered_results.append(entry_dict)
-    
-    print(f"=== SUMMARY ===")
-    print(f"Total entries: {len(all_results)} | Passing: {len(filtered_results)}")
+    print(f"\n=== SUMMARY ===")
+    print(f"Total entries: {total_count} | Passing: {len(filtered_results)}")
+    path_count, prefix_count, table_bytes, full_bytes = table_stats(path_table)
+    print(f"Image paths: {path_count} under {prefix_count} prefixes ({table_bytes / 1e6:.1f} MB interned vs {full_bytes / 1e6:.1f} MB as full strings)")
     
     # Split data into train, test, val
-    train_data, test_data, val_data = split_data(filtered_results, TRAIN_RATIO, VAL_RATIO)
-    
-    # Prepare CSV data for each split
-    def prepare_csv_data(data_split):
-        csv_data = []
-        for entry in data_split:
-            image_path = entry['image']
-            
-            # Get damage level for Task 4 filtering
-            damage_level = 'N/A'
-            if 'Task 3' in entry:
-                for line in entry['Task 3']:
-                    if line.startswith('Damage = '):
-                        damage_level = line.split('Damage = ')[1].strip()
-                        break
+    if SPLIT_MODE == 'stratified':
+        train_data, test_data, val_data = finish_stratified(splitter)
+        print(f"\n{format_stratum_report(splitter)}")
+    elif SPLIT_MODE == 'hash':
+        image_path_of = lambda entry: expand_path(path_table, entry['image'])
+        train_data, test_data, val_data = hash_split_data(filtered_results, TRAIN_RATIO, VAL_RATIO, image_path_of, SPLIT_SALT)
+    else:
+        train_data, test_data, val_data = split_data(filtered_results, TRAIN_RATIO, VAL_RATIO)
+    
+    # Rows of each split are generated a batch of images at a time and streamed straight to its writer
+    dedup_stats = new_dedup_stats()
+    def iter_csv_batches(data_split, dedup_stats=None):
+        for batch_start in range(0, len(data_split), CSV_BATCH_IMAGES):
+            image_captions = []
+            for entry in data_split[batch_start:batch_start + CSV_BATCH_IMAGES]:
+                image_path = expand_path(path_table, entry['image'])
+                
+                # Get damage level for Task 4 filtering
+                damage_level = 'N/A'
+                if 'Task 3' in entry:
+                    for line in entry['Task 3']:
+                        if line.startswith('Damage = '):
+                            damage_level = line.split('Damage = ')[1].strip()
+                            break
+                
+                # Collect all captions
+                captions = []
+                if 'Task 1' in entry:
+                    captions.extend(entry['Task 1'])
+                
+                # Add Task 4 captions if damage level is present and INCLUDE_TASK_4 is True
+                if damage_level != 'N/A' and 'Task 4' in entry and INCLUDE_TASK_4:
+                    for line in entry['Task 4']:
+                        if line.strip() and line.strip().upper() != 'NA':
+                            captions.append(line.strip())
+                
+                image_captions.append((image_path, captions))
             
-            # Collect all captions
-            captions = []
-            if 'Task 1' in entry:
-                captions.extend(entry['Task 1'])
+            # Drop near-duplicate captions (e.g. the same phrase from two caption models) before combining
+            if DEDUP_CAPTIONS:
+                image_captions = dedup_captions_batch(image_captions, DEDUP_THRESHOLD, dedup_stats)
             
-            # Add Task 4 captions if damage level is present and INCLUDE_TASK_4 is True
-            if damage_level != 'N/A' and 'Task 4' in entry and INCLUDE_TASK_4:
-                for line in entry['Task 4']:
-                    if line.strip() and line.strip().upper() != 'NA':
-                        captions.append(line.strip())
+            # Apply caption combining strategy to the batch if enabled (results don't depend on batching)
+            if COMBINE_CAPTIONS:
+                combined = combine_captions(image_captions, COMBINE_MODE, MAX_WORDS, TOKEN_BUDGET, CAPTION_TOKENIZER, COMBINE_SEED)
+                image_captions = [(image_path, captions) for (image_path, _), captions in zip(image_captions, combined)]
             
-            # Apply caption combining strategy if enabled
-            if COMBINE_CAPTIONS and captions:
-                captions = generate_combined_captions(captions, MAX_WORDS)
-            
-            # Create multiple CSV rows for each caption
-            for caption in captions:
-                csv_data.append({
-                    CSV_IMG_KEY: image_path,
-                    CSV_CAPTION_KEY: caption
-                })
-        return csv_data
-    
-    # Generate CSV data for each split
-    train_csv = prepare_csv_data(train_data)
-    test_csv = prepare_csv_data(test_data)
-    val_csv = prepare_csv_data(val_data)
+            # One CSV row per caption
+            yield [(image_path, caption) for image_path, captions in image_captions for caption in captions]
     
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    # Write separate CSV files for each split
-    splits = [
-        ('train', train_csv),
-        ('test', test_csv),
-        ('val', val_csv)
-    ]
-    
-    for split_name, csv_data in splits:
-        csv_output_path = os.path.join(OUTPUT_DIR, f"{OUTPUT_SUFFIX}_{split_name}.csv")
-        
-        with open(csv_output_path, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = [CSV_IMG_KEY, CSV_CAPTION_KEY]
-            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=CSV_SEPARATOR)
-            writer.writeheader()
-            writer.writerows(csv_data)
-        
-        print(f"{split_name.upper()} CSV: {csv_output_path} ({len(csv_data)} entries)")
+    # Write separate CSV files for each split, all three filled side by side by their own writer threads
+    split_lists = {'train': train_data, 'test': test_data, 'val': val_data}
+    csv_extension = '.csv.gz' if CSV_COMPRESS else '.csv'
+    outputs = {}
+    columnar_outputs = {}
+    shard_outputs = {}
+    for split_name in SPLIT_NAMES:
+        csv_output_path = os.path.join(OUTPUT_DIR, f"{OUTPUT_SUFFIX}_{split_name}{csv_extension}")
+        # Incremental runs merge new rows into the existing split files
+        append = append_outputs and os.path.exists(csv_output_path)
+        write_rows, close = open_csv_stream(csv_output_path, (CSV_IMG_KEY, CSV_CAPTION_KEY), append, CSV_SEPARATOR)
+        outputs[split_name] = (csv_output_path, append, write_rows, close)
+        # Columnar files can't be appended to, so they are only (re)written on full runs
+        if COLUMNAR_OUTPUT and not append:
+            columnar_output_path = columnar_path(csv_output_path, COLUMNAR_OUTPUT)
+            columnar_outputs[split_name] = (columnar_output_path,) + open_columnar_stream(columnar_output_path, (CSV_IMG_KEY, CSV_CAPTION_KEY))
+        elif COLUMNAR_OUTPUT:
+            print(f"⚠️  Not updating the {COLUMNAR_OUTPUT} {split_name} file on an incremental run - rerun without INCREMENTAL_MODE to rebuild it")
+        # Shards are likewise only packed on full runs
+        if WEBDATASET_SHARDS and not append:
+            shards_name = f"{OUTPUT_SUFFIX}_{split_name}"
+            shards_dir = os.path.join(OUTPUT_DIR, f"{shards_name}_shards")
+            shard_outputs[split_name] = (shards_dir, shards_name) + open_shard_stream(shards_dir, shards_name, IMAGE_BASE_DIR)
+        elif WEBDATASET_SHARDS:
+            print(f"⚠️  Not updating the {split_name} shards on an incremental run - rerun without INCREMENTAL_MODE to rebuild them")
+    split_batches = []
+    for split_name in SPLIT_NAMES:
+        writes = [outputs[split_name][2]]
+        if split_name in columnar_outputs:
+            writes.append(columnar_outputs[split_name][1])
+        if split_name in shard_outputs:
+            writes.append(shard_outputs[split_name][2])
+        # Val images are drawn from test, so only train and test are counted
+        split_batches.append((iter_csv_batches(split_lists[split_name], dedup_stats if split_name != 'val' else None), writes))
+    write_interleaved(split_batches)
+    
+    row_counts = {}
+    for split_name, (csv_output_path, append, _, close) in outputs.items():
+        row_counts[split_name] = close()
+        print(f"{split_name.upper()} CSV: {csv_output_path} ({'+' if append else ''}{row_counts[split_name]} entries)")
+    for split_name, (columnar_output_path, _, close) in columnar_outputs.items():
+        print(f"{split_name.upper()} {COLUMNAR_OUTPUT.upper()}: {columnar_output_path} ({close()} entries)")
+    for split_name, (shards_dir, shards_name, _, close) in shard_outputs.items():
+        print(f"{split_name.upper()} SHARDS: {format_shard_report(shards_dir, shards_name, close())}")
+    
+    # Checkpoint only after the outputs are written, so an interrupted run is simply redone
+    if INCREMENTAL_MODE:
+        with open(CHECKPOINT_FILE, 'w') as f:
+            json.dump(checkpoints, f, indent=2)
+        print(f"Checkpoint: {CHECKPOINT_FILE}")
     
     # Print split statistics
     print(f"\n=== SPLIT STATISTICS ===")
-    print(f"Train: {len(train_data)} images ({len(train_csv)} caption entries)")
-    print(f"Test: {len(test_data)} images ({len(test_csv)} caption entries)")
-    print(f"Val: {len(val_data)} images ({len(val_csv)} caption entries)")
-    
-    train_pct = len(train_data) / len(filtered_results) * 100
-    test_pct = len(test_data) / len(filtered_results) * 100
-    val_pct = len(val_data) / len(filtered_results) * 100
+    print(f"Train: {len(train_data)} images ({row_counts['train']} caption entries)")
+    print(f"Test: {len(test_data)} images ({row_counts['test']} caption entries)")
+    print(f"Val: {len(val_data)} images ({row_counts['val']} caption entries)")
+    if DEDUP_CAPTIONS:
+        print(format_dedup_stats(dedup_stats))
+    
+    train_pct = len(train_data) / len(filtered_results) * 100 if filtered_results else 0
+    test_pct = len(test_data) / len(filtered_results) * 100 if filtered_results else 0
+    val_pct = len(val_data) / len(filtered_results) * 100 if filtered_results else 0
     print(f"Percentages - Train: {train_pct:.1f}%, Test: {test_pct:.1f}%, Val: {val_pct:.1f}%")
     
-    return train_csv, test_csv, val_csv
+    return row_counts['train'], row_counts['test'], row_counts['val']
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,23 @@
 #!/usr/bin/env python3
 """Parse caption data with Task 3 filtering and CSV output with caption combining logic"""
 
-import re
-import csv
 import os
+import json
 import random
+from itertools import islice
+
+import numpy as np
+
+from caption_join import join_by_image, sort_by_image
+from caption_combine import combine_captions
+from caption_dedup import dedup_captions_batch, format_dedup_stats, new_dedup_stats
+from columnar_output import columnar_path, open_columnar_stream
+from csv_stream import open_csv_stream, write_interleaved
+from entry_parser import parse_entries
+from path_table import expand_path, intern_path, new_path_table
+from split_assign import entry_stratum, format_stratum_report, hash_split_data, stratified_split_data
+from parse_cache import cached_parse
+from task_index import build_task_index, overall_pass_mask
 
 # === CONFIGURATION ===
 INPUT_FILES = {
@@ -30,10 +43,30 @@ DAMAGE_FILTERS = {
 
 CSV_OUTDIR = '/home/cynapse/zhenyang/caption_parser/output_csv/'
 VISIBILITY_THRESHOLD = 45
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
+PARSE_WORKERS = 1  # Set above 1 to parse large input files across a process pool (.gz/.zst inputs always use one)
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024  # Target size of each byte range handed to a parse worker
+FILTER_BATCH_SIZE = 4096  # Entries indexed and filtered together while streaming a source
+
+# === PARSE CACHE ===
+PARSE_CACHE_DIR = '/home/cynapse/zhenyang/caption_parser/parse_cache/'  # Set to None to always re-parse
+PARSE_CACHE_MAX_BYTES = 20 * 1024 ** 3  # Least recently used cache files are evicted above this size
+PARSE_CACHE_HASH_CONTENT = False  # Key on a content hash instead of mtime (slower, survives touch/copy)
 MAX_WORDS = 30
 COMBINE_CAPTIONS = True
+COMBINE_SEED = 0  # Seed of the per-image caption shuffle - same seed and image give the same combined captions
+COMBINE_MODE = 'words'  # 'words': even groups of about MAX_WORDS words; 'tokens': fewest rows that each fit TOKEN_BUDGET
+TOKEN_BUDGET = 75  # CLIP text tokens per combined caption (77-token context minus start/end tokens)
+CAPTION_TOKENIZER = None  # None estimates token counts; a Hugging Face CLIP tokenizer name (needs transformers) counts exactly
+DEDUP_CAPTIONS = False  # Drop near-duplicate captions within each image (MinHash/LSH) of the DAMAGE_JOIN_PREFIX iterations, where two models' captions meet, before combining
+DEDUP_THRESHOLD = 0.6  # Jaccard similarity of two captions' content words at which the shorter one is dropped
 TRAIN_RATIO = 0.8
 VAL_RATIO = 0.2
+SPLIT_MODE = 'hash'  # 'hash': each image's split follows a stable hash of its path (same on re-runs and appends); 'stratified': exact ratios per (damage, source, camera folder), small folders pooled per (damage, source); 'random': reshuffle every run
+SPLIT_SALT = ''  # Change to draw a different, but again stable, hash split
+
+# Iterations named with this prefix are joined by image path into one combined damage output
+DAMAGE_JOIN_PREFIX = 'gemini_and_openai_damage'
 
 # Special split ratios for gemini_and_openai_damage iterations
 DAMAGE_TRAIN_RATIO = 0.5
@@ -43,11 +76,21 @@ DAMAGE_VAL_RATIO = 0.2
 # === CSV OUTPUT OPTIONS ===
 OUTPUT_INDIVIDUAL_CSV = False  # Set to False to skip individual train/test/val files
 APPEND_TO_COMBINED = True    # Set to True to append to combined files instead
+# Record the (iteration, source, image) entries each combined file holds, so re-runs only append new images, never move
+# an image between train and test/val, and refuse to touch a combined file that was changed behind the manifest's back
+# (delete both to start over)
+APPEND_MANIFEST = True
+MANIFEST_FILE = os.path.join(CSV_OUTDIR, f"{OUTPUT_SUFFIX}_manifest.json")
 
 # === CSV FORMAT OPTIONS ===
 CSV_IMG_KEY = 'image_path'
 CSV_CAPTION_KEY = 'caption'
 CSV_SEPARATOR = ','
+CSV_COMPRESS = False  # Write .csv.gz files, gzip-compressed on the writer threads
+CSV_BATCH_IMAGES = 4096  # Images whose rows are generated and handed to the writers at a time
+# 'parquet' or 'arrow' (Arrow IPC) to also write columnar outputs: one next to each individual CSV, and one part
+# per append in a {OUTPUT_SUFFIX}_{split}_{format} directory standing in for each appended combined CSV
+COLUMNAR_OUTPUT = None
 
 INCLUDE_TAGS = {
     '[Subject]': False, 
@@ -62,161 +105,41 @@ INCLUDE_TAGS = {
 INCLUDE_ALL_TAGS = False
 INCLUDE_TASK_4 = False
 
-def filter_tags(line):
-    """Filter content based on tag configuration"""
-    if not line:
-        return line.strip()
-    
-    if INCLUDE_ALL_TAGS:
-        return re.sub(r'\[.*?\]\s*', '', line).strip()
-    
-    tags = re.findall(r'\[.*?\]', line)
-    if not tags:
-        return line.strip()
-    
-    has_enabled_tag = any(tag in INCLUDE_TAGS and INCLUDE_TAGS[tag] for tag in tags)
-    if not has_enabled_tag:
-        return ''
-    
-    result_parts = []
-    parts = re.split(r'(\[.*?\])', line)
-    
-    for i, part in enumerate(parts):
-        if part.startswith('[') and part.endswith(']'):
-            tag = part
-            if tag in INCLUDE_TAGS and INCLUDE_TAGS[tag]:
-                if i + 1 < len(parts):
-                    content = parts[i + 1].strip()
-                    if content:
-                        result_parts.append(content)
-    
-    return ' '.join(result_parts).strip()
-
 def parse_to_json(filename):
-    """Parse input file and return structured data"""
-    results = []
-    
-    with open(filename, 'r') as file:
-        content = file.read()
-    
-    entries = content.strip().split('\n\n')
-    
-    for entry in entries:
-        if not entry.strip():
-            continue
-            
-        lines = entry.strip().split('\n')
-        if not lines or ':' not in lines[0]:
-            continue
-            
-        image_path = lines[0].split(':')[0].strip()
-        entry_dict = {"image": image_path}
-        
-        current_task = None
-        current_content = []
-        
-        for line in lines[1:]:
-            line = line.strip()
-            if line.startswith('Task '):
-                if current_task:
-                    entry_dict[current_task] = current_content
-                current_task = line
-                current_content = []
-            elif line:
-                cleaned_line = filter_tags(line)
-                if cleaned_line:
-                    current_content.append(cleaned_line)
-        
-        if current_task:
-            entry_dict[current_task] = current_content
-        
-        results.append(entry_dict)
-    
-    return results
-
-def filter_task_3(entry_dict, damage_filter):
-    """Filter Task 3 based on damage values"""
-    if 'Task 3' not in entry_dict:
-        return False
-    
-    task3_content = entry_dict['Task 3']
-    for line in task3_content:
-        if line.startswith('Damage = '):
-            damage_value = line.split('Damage = ')[1].strip()
-            if any(x.lower() in damage_value.lower() for x in damage_filter):
-                return True
-    return False
-
-def check_task5_vehicle_yes(entry_dict):
-    """Check if Task 5 contains 'Vehicle: Yes'"""
-    if 'Task 5' not in entry_dict:
-        return False
-    return any(line.strip() == 'Vehicle: Yes' for line in entry_dict['Task 5'])
-
-def check_task6_visibility_N_plus(entry_dict):
-    """Check if Task 6 visibility >= threshold"""
-    if 'Task 6' not in entry_dict:
-        return False
-    for line in entry_dict['Task 6']:
-        if line.strip().startswith("Visibility = "):
-            try:
-                visibility_value = int(line.strip().split("= ")[1])
-                return visibility_value >= VISIBILITY_THRESHOLD
-            except (ValueError, IndexError):
-                continue
-    return False
+    """Parse input file and yield structured data one entry at a time"""
+    return parse_entries(filename, (INCLUDE_TAGS, INCLUDE_ALL_TAGS), PARSE_WORKERS, READ_BUFFER_SIZE, PARSE_CHUNK_BYTES)
 
-def check_task7_visibility_day(entry_dict):
-    """Check if Task 7 contains 'Time = day'"""
-    if 'Task 7' not in entry_dict:
-        return False
-    return any(line.strip() == 'Time = day' for line in entry_dict['Task 7'])
+def parse_to_json_cached(filename):
+    """Parse input file through the on-disk parse cache when PARSE_CACHE_DIR is set"""
+    if not PARSE_CACHE_DIR:
+        return parse_to_json(filename)
+    tag_config = {'include_tags': INCLUDE_TAGS, 'include_all_tags': INCLUDE_ALL_TAGS}
+    return cached_parse(filename, parse_to_json, PARSE_CACHE_DIR, tag_config,
+                        PARSE_CACHE_MAX_BYTES, PARSE_CACHE_HASH_CONTENT)
 
-def check_task8_multiple_no(entry_dict):
-    """Check if Task 8 contains 'Multiple = no'"""
-    if 'Task 8' not in entry_dict:
-        return False
-    return any(line.strip() == 'Multiple = no' for line in entry_dict['Task 8'])
-
-def generate_combined_captions(captions, max_words=20):
-    """Combine captions using the specified strategy"""
-    if len(captions) <= 1:
-        return captions
-    
-    shuffled_captions = list(captions)
-    random.shuffle(shuffled_captions)
-    
-    total_words = sum(len(caption.split()) for caption in captions)
-    target_caption_count = max(1, total_words // max_words + 1)
-    
-    # Ensure we don't create more groups than we have captions
-    target_caption_count = min(target_caption_count, len(captions))
-    
-    # Distribute captions evenly across target count
-    captions_per_group = len(shuffled_captions) // target_caption_count
-    remainder = len(shuffled_captions) % target_caption_count
-    
-    combined_captions = []
-    start_idx = 0
-    
-    for i in range(target_caption_count):
-        # Add extra caption to first 'remainder' groups for even distribution
-        current_captions = captions_per_group + (1 if i < remainder else 0)
-        end_idx = start_idx + current_captions
-        
-        group_captions = shuffled_captions[start_idx:end_idx]
-        combined_captions.append(", ".join(group_captions))
-        start_idx = end_idx
-    
-    # If we have remaining captions, add them to the last group
-    if start_idx < len(shuffled_captions):
-        remaining_captions = shuffled_captions[start_idx:]
-        if combined_captions:
-            combined_captions[-1] += ", " + ", ".join(remaining_captions)
-        else:
-            combined_captions.append(", ".join(remaining_captions))
-    
-    return combined_captions
+def filter_source(input_file, iteration_filters, path_table):
+    """Filter one source for all its iterations in a single pass, returning (entry count, passing entries per iteration)"""
+    survivors = {key: [] for key in iteration_filters}
+    total_count = 0
+    entries = iter(parse_to_json_cached(input_file))
+    while True:
+        batch = list(islice(entries, FILTER_BATCH_SIZE))
+        if not batch:
+            break
+        total_count += len(batch)
+        # Task 3/5/6/7/8 checks for a whole batch in one vectorized pass per iteration
+        task_index = build_task_index(batch)
+        pass_masks = {
+            key: overall_pass_mask(task_index, VISIBILITY_THRESHOLD, damage_filter)
+            for key, damage_filter in iteration_filters.items()
+        }
+        # Passing entries keep an integer path ID instead of the full path string
+        for entry_dict, any_pass in zip(batch, np.logical_or.reduce(list(pass_masks.values()))):
+            if any_pass:
+                entry_dict['image'] = intern_path(path_table, entry_dict['image'])
+        for key, pass_mask in pass_masks.items():
+            survivors[key].extend(entry_dict for entry_dict, overall_pass in zip(batch, pass_mask) if overall_pass)
+    return total_count, survivors
 
 def split_data(data, train_ratio, val_ratio):
     """Split data into train, test, and val sets"""
@@ -237,42 +160,87 @@ def split_data(data, train_ratio, val_ratio):
     
     return train_data, test_data, val_data
 
-def prepare_csv_data(data_split):
-    """Prepare CSV data for a given data split"""
-    csv_data = []
-    for entry in data_split:
-        image_path = entry['image']
-        
-        # Get damage level for Task 4 filtering
-        damage_level = 'N/A'
-        if 'Task 3' in entry:
-            for line in entry['Task 3']:
-                if line.startswith('Damage = '):
-                    damage_level = line.split('Damage = ')[1].strip()
-                    break
-        
-        # Collect all captions
-        captions = []
-        if 'Task 1' in entry:
-            captions.extend(entry['Task 1'])
+def iter_csv_batches(data_split, path_table, dedup=False, dedup_stats=None):
+    """Yield lists of (image_path, caption) rows for a data split, a batch of images at a time (dedup counts go to dedup_stats)"""
+    for batch_start in range(0, len(data_split), CSV_BATCH_IMAGES):
+        image_captions = []
+        for entry in data_split[batch_start:batch_start + CSV_BATCH_IMAGES]:
+            image_path = expand_path(path_table, entry['image'])
+            
+            # Get damage level for Task 4 filtering
+            damage_level = 'N/A'
+            if 'Task 3' in entry:
+                for line in entry['Task 3']:
+                    if line.startswith('Damage = '):
+                        damage_level = line.split('Damage = ')[1].strip()
+                        break
+            
+            # Collect all captions
+            captions = []
+            if 'Task 1' in entry:
+                captions.extend(entry['Task 1'])
+            
+            # Add Task 4 captions if damage level is present and INCLUDE_TASK_4 is True
+            if damage_level != 'N/A' and 'Task 4' in entry and INCLUDE_TASK_4:
+                for line in entry['Task 4']:
+                    if line.strip() and line.strip().upper() != 'NA':
+                        captions.append(line.strip())
+            
+            image_captions.append((image_path, captions))
         
-        # Add Task 4 captions if damage level is present and INCLUDE_TASK_4 is True
-        if damage_level != 'N/A' and 'Task 4' in entry and INCLUDE_TASK_4:
-            for line in entry['Task 4']:
-                if line.strip() and line.strip().upper() != 'NA':
-                    captions.append(line.strip())
+        # Drop near-duplicate captions (e.g. the same phrase from two caption models) before combining
+        if dedup:
+            image_captions = dedup_captions_batch(image_captions, DEDUP_THRESHOLD, dedup_stats)
         
-        # Apply caption combining strategy if enabled
-        if COMBINE_CAPTIONS and captions:
-            captions = generate_combined_captions(captions, MAX_WORDS)
+        # Apply caption combining strategy to the batch if enabled (results don't depend on batching)
+        if COMBINE_CAPTIONS:
+            combined = combine_captions(image_captions, COMBINE_MODE, MAX_WORDS, TOKEN_BUDGET, CAPTION_TOKENIZER, COMBINE_SEED)
+            image_captions = [(image_path, captions) for (image_path, _), captions in zip(image_captions, combined)]
         
-        # Create multiple CSV rows for each caption
-        for caption in captions:
-            csv_data.append({
-                CSV_IMG_KEY: image_path,
-                CSV_CAPTION_KEY: caption
-            })
-    return csv_data
+        # One CSV row per caption
+        yield [(image_path, caption) for image_path, captions in image_captions for caption in captions]
+
+def load_manifest(combined_paths):
+    """Load the append manifest and check it still describes every combined file, raising ValueError when one doesn't"""
+    manifest = {}
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+    
+    for combined_path in combined_paths:
+        name = os.path.basename(combined_path)
+        size = os.path.getsize(combined_path) if os.path.exists(combined_path) else 0
+        if name not in manifest:
+            if size:
+                raise ValueError(f"{combined_path} has no entry in {MANIFEST_FILE}, so its rows can't be told apart from new ones - "
+                                 f"delete it to regenerate, or set APPEND_MANIFEST = False to append blindly")
+        elif not os.path.exists(combined_path):
+            print(f"⚠️  {combined_path} was deleted, starting it over")
+            del manifest[name]
+        elif size != manifest[name]['bytes']:
+            raise ValueError(f"{combined_path} is {size} bytes but {MANIFEST_FILE} recorded {manifest[name]['bytes']} - it was changed "
+                             f"outside this script or an append was interrupted; truncate it to {manifest[name]['bytes']} bytes, "
+                             f"or delete it to regenerate")
+    return manifest
+
+def save_manifest(manifest):
+    """Write the append manifest in one step, so it never describes a half-written state"""
+    temp_path = f"{MANIFEST_FILE}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, MANIFEST_FILE)
+
+def manifest_record(manifest, combined_path):
+    """Manifest entry of one combined file: its size, row count, columnar parts and images per iteration and source"""
+    return manifest.setdefault(os.path.basename(combined_path), {'bytes': 0, 'rows': 0, 'parts': 0, 'images': {}})
+
+def split_conflicts(manifest, combined_paths, split_name, iteration_name, source):
+    """Images this iteration and source already wrote on the other side of the train / held-out (test and val) line"""
+    conflicts = set()
+    for other_split, other_path in combined_paths.items():
+        if (other_split == 'train') != (split_name == 'train') and os.path.basename(other_path) in manifest:
+            conflicts.update(manifest[os.path.basename(other_path)]['images'].get(iteration_name, {}).get(source, []))
+    return conflicts
 
 def main():
     print("=== TAG FILTERING CONFIGURATION ===")
@@ -287,93 +255,102 @@ def main():
     print(f"Append to combined files: {APPEND_TO_COMBINED}")
     if APPEND_TO_COMBINED:
         print(f"Combined files will be: {OUTPUT_SUFFIX}_{{train/test/val}}.csv")
+        print(f"Append manifest: {MANIFEST_FILE if APPEND_MANIFEST else 'off'}")
     print("="*50 + "\n")
+    
+    # Check the combined files against the manifest before any parsing, so a refusal costs nothing
+    manifest = None
+    combined_paths = {split_name: os.path.join(CSV_OUTDIR, f"{OUTPUT_SUFFIX}_{split_name}{'.csv.gz' if CSV_COMPRESS else '.csv'}")
+                      for split_name in ('train', 'test', 'val')}
+    if APPEND_TO_COMBINED and APPEND_MANIFEST:
+        manifest = load_manifest(list(combined_paths.values()))
 
-    gemini_and_openai_damage_list = set()
-    openai_damage_data = {}  # Store openai damage data for combination
+    # Damage iterations are joined by image path at the last one, whatever the number of sources
+    damage_join_iterations = [i for i, (iteration_name, _) in enumerate(ITERATION_CONFIG)
+                              if iteration_name.startswith(DAMAGE_JOIN_PREFIX)]
+    damage_join_sources = []  # Stored damage data of the earlier damage iterations
+    
+    # Group iterations by source so every source is parsed and filtered exactly once
+    source_filters = {}
+    for i, (iteration_name, input_file_key) in enumerate(ITERATION_CONFIG):
+        source_filters.setdefault(INPUT_FILES[input_file_key], {})[i] = DAMAGE_FILTERS[iteration_name]
+    
+    source_counts = {}
+    iteration_results = {}
+    path_table = new_path_table()  # Shared by all sources, so joins compare path IDs
+    for input_file, iteration_filters in source_filters.items():
+        iteration_names = ', '.join(ITERATION_CONFIG[i][0] for i in iteration_filters)
+        print(f"Parsing {input_file} for {iteration_names}...")
+        source_counts[input_file], survivors = filter_source(input_file, iteration_filters, path_table)
+        iteration_results.update(survivors)
+    print()
     
     # Process each iteration
-    for iteration_name, input_file_key in ITERATION_CONFIG:
+    for i, (iteration_name, input_file_key) in enumerate(ITERATION_CONFIG):
         print(f"{'='*60}")
         print(f"ITERATION {iteration_name.upper()}")
         print(f"Input file: {INPUT_FILES[input_file_key]}")
         print(f"Damage filter: {DAMAGE_FILTERS[iteration_name]}")
         print(f"{'='*60}\n")
         
-        current_damage_filter = DAMAGE_FILTERS[iteration_name]
-        
-        print(f"Parsing {INPUT_FILES[input_file_key]}...")
-        all_results = parse_to_json(INPUT_FILES[input_file_key])
-        
-        filtered_results = []
+        input_file = INPUT_FILES[input_file_key]
+        total_count = source_counts[input_file]
+        source = input_file_key
         
         print("=== FILTERING BY TASK 5, 6, 7, AND 8 ===")
-
-        for entry_dict in all_results:
-            task5_pass = check_task5_vehicle_yes(entry_dict)
-            task6_pass = check_task6_visibility_N_plus(entry_dict)
-            task7_pass = check_task7_visibility_day(entry_dict)
-            task8_pass = check_task8_multiple_no(entry_dict)
-            task3_pass = filter_task_3(entry_dict, current_damage_filter)
-            
-            overall_pass = all([task5_pass, task6_pass, task7_pass, task8_pass, task3_pass])
-
-            if iteration_name == 'gemini_and_openai_damage(gemini)' and input_file_key == 'gemini':
-                if entry_dict['image'] not in gemini_and_openai_damage_list:
-                    overall_pass = False
-            
-            if overall_pass:
-                if iteration_name == 'gemini_and_openai_damage(openai)' and input_file_key == 'openai':
-                    gemini_and_openai_damage_list.add(entry_dict['image'])
-                filtered_results.append(entry_dict)
+        filtered_results = iteration_results.pop(i)
         
         print(f"=== SUMMARY FOR {iteration_name.upper()} ===")
-        print(f"Total entries: {len(all_results)} | Passing: {len(filtered_results)}")
+        print(f"Total entries: {total_count} | Passing: {len(filtered_results)}")
         
-        # Handle special case for gemini_and_openai_damage combination
-        if iteration_name == 'gemini_and_openai_damage(openai)' and input_file_key == 'openai':
-            # Store openai damage data for later combination with gemini
-            openai_damage_data = {
+        # Handle special case for the gemini_and_openai_damage join
+        if iteration_name.startswith(DAMAGE_JOIN_PREFIX) and i != damage_join_iterations[-1]:
+            # Store damage data for the join at the last damage iteration
+            damage_join_sources.append({
                 'filtered_results': filtered_results,
                 'input_base': INPUT_FILES[input_file_key].split('/')[-1].split('.')[0],
-                'iteration_name': iteration_name
-            }
-            print(f"\nStored OpenAI damage data for combination with Gemini data")
+                'input_file_key': input_file_key
+            })
+            print(f"\nStored {input_file_key} damage data for the join with the other damage sources")
             print(f"Completed iteration: {iteration_name}")
             print(f"{'='*60}\n")
             continue
         
-        elif iteration_name == 'gemini_and_openai_damage(gemini)' and input_file_key == 'gemini':
-            # Combine gemini data with stored openai data
-            if openai_damage_data:
-                print("\n=== COMBINING GEMINI AND OPENAI DAMAGE DATA ===")
-                
-                # Create a mapping of openai images to their data
-                openai_image_map = {item['image']: item for item in openai_damage_data['filtered_results']}
+        elif iteration_name.startswith(DAMAGE_JOIN_PREFIX):
+            if damage_join_sources:
+                source_keys = [input_file_key] + [source['input_file_key'] for source in damage_join_sources]
+                print(f"\n=== JOINING DAMAGE DATA FROM {', '.join(source_keys).upper()} ===")
                 
-                # Combine captions for matching images
+                # Sort-merge join on path ID - an image is kept only if it passed in every source
+                sorted_sources = [
+                    sort_by_image((item['image'], item) for item in results)
+                    for results in [filtered_results] + [source['filtered_results'] for source in damage_join_sources]
+                ]
                 combined_results = []
-                for gemini_item in filtered_results:
-                    image_name = gemini_item['image']
-                    if image_name in openai_image_map:
-                        # Combine captions from both sources
-                        combined_item = gemini_item.copy()
+                for image_name, source_items in join_by_image(sorted_sources, 'inner'):
+                    # Other sources contribute their last entry for the image, matched to each entry of this one
+                    other_items = [items[-1] for items in source_items[1:]]
+                    for item in source_items[0]:
+                        combined_item = item.copy()
                         
-                        # Combine Task 1 captions
-                        if 'Task 1' in gemini_item and 'Task 1' in openai_image_map[image_name]:
-                            combined_captions = gemini_item['Task 1'] + openai_image_map[image_name]['Task 1']
-                            combined_item['Task 1'] = combined_captions
+                        # Combine Task 1 captions in source order
+                        if 'Task 1' in item:
+                            combined_item['Task 1'] = item['Task 1'] + [
+                                caption for other_item in other_items for caption in other_item.get('Task 1', [])
+                            ]
                         
                         combined_results.append(combined_item)
                 
-                print(f"Combined {len(combined_results)} matching images from Gemini and OpenAI")
+                print(f"Combined {len(combined_results)} matching images from {', '.join(source_keys)}")
                 filtered_results = combined_results
+                source = '+'.join(source_keys)
                 
                 # Use combined naming for output
-                input_base = f"combined_{openai_damage_data['input_base']}_gemini"
+                input_base = f"combined_{damage_join_sources[0]['input_base']}_{input_file_key}"
                 output_suffix = f"{OUTPUT_SUFFIX}_combined_damage"
+                damage_join_sources = []
             else:
-                print("⚠️ No OpenAI damage data found for combination")
+                print("⚠️ No other damage data found for the join")
                 input_base = INPUT_FILES[input_file_key].split('/')[-1].split('.')[0]
                 output_suffix = f"{OUTPUT_SUFFIX}_{iteration_name}"
         else:
@@ -392,60 +369,134 @@ def main():
             print(f"Using standard split ratios: Train={current_train_ratio}, Val={current_val_ratio}")
         
         # Split data into train, test, val
-        train_data, test_data, val_data = split_data(filtered_results, current_train_ratio, current_val_ratio)
-        
-        # Generate CSV data for each split
-        train_csv = prepare_csv_data(train_data)
-        test_csv = prepare_csv_data(test_data)
-        val_csv = prepare_csv_data(val_data)
+        # Hash splits keep an image in the same split across runs and APPEND_TO_COMBINED appends (for the same ratios)
+        if SPLIT_MODE == 'stratified':
+            image_path_of = lambda entry: expand_path(path_table, entry['image'])
+            stratum_of = lambda entry: entry_stratum(entry, source, image_path_of(entry))
+            train_data, test_data, val_data, splitter = stratified_split_data(filtered_results, current_train_ratio, current_val_ratio, stratum_of, image_path_of, SPLIT_SALT)
+            print(format_stratum_report(splitter))
+        elif SPLIT_MODE == 'hash':
+            image_path_of = lambda entry: expand_path(path_table, entry['image'])
+            train_data, test_data, val_data = hash_split_data(filtered_results, current_train_ratio, current_val_ratio, image_path_of, SPLIT_SALT)
+        else:
+            train_data, test_data, val_data = split_data(filtered_results, current_train_ratio, current_val_ratio)
         
         os.makedirs(CSV_OUTDIR, exist_ok=True)
         
-        # Prepare split data
-        splits = [
-            ('train', train_csv),
-            ('test', test_csv),
-            ('val', val_csv)
-        ]
+        # Rows are generated a batch at a time and streamed to every enabled output of their split,
+        # with each file written (and compressed) by its own thread so all splits fill side by side
+        dedup = DEDUP_CAPTIONS and iteration_name.startswith(DAMAGE_JOIN_PREFIX)
+        dedup_stats = new_dedup_stats()
+        split_lists = {'train': train_data, 'test': test_data, 'val': val_data}
+        csv_extension = '.csv.gz' if CSV_COMPRESS else '.csv'
+        header = (CSV_IMG_KEY, CSV_CAPTION_KEY)
+        row_counts = dict.fromkeys(split_lists, 0)
+        individual_outputs = {}
+        combined_outputs = {}
+        columnar_outputs = {}
+        combined_columnar_outputs = {}
+        manifest_appends = {}
+        for split_name in split_lists:
+            columnar_outputs[split_name] = []
+            # Write individual CSV files if enabled
+            if OUTPUT_INDIVIDUAL_CSV:
+                csv_output_path = os.path.join(CSV_OUTDIR, f"{input_base}_{output_suffix}_{split_name}{csv_extension}")
+                individual_outputs[split_name] = (csv_output_path,) + open_csv_stream(csv_output_path, header, False, CSV_SEPARATOR)
+                if COLUMNAR_OUTPUT:
+                    columnar_output_path = columnar_path(csv_output_path, COLUMNAR_OUTPUT)
+                    columnar_outputs[split_name].append((columnar_output_path,) + open_columnar_stream(columnar_output_path, header))
+            # Append to combined CSV files if enabled (the header is only written to a new file)
+            if APPEND_TO_COMBINED:
+                combined_output_path = combined_paths[split_name]
+                part_name = f"{input_base}_{output_suffix}"
+                if manifest is not None:
+                    # Only images this iteration and source haven't added to the file yet are appended
+                    record = manifest_record(manifest, combined_output_path)
+                    known_paths = set(record['images'].get(iteration_name, {}).get(source, []))
+                    run_paths = {expand_path(path_table, entry['image']) for entry in split_lists[split_name]}
+                    held_paths = run_paths & known_paths
+                    new_paths = run_paths - known_paths
+                    # An image keeps the side of the train / held-out line it was first written to, whatever this run drew
+                    conflicts = new_paths & split_conflicts(manifest, combined_paths, split_name, iteration_name, source)
+                    if conflicts:
+                        other_side = 'test/val' if split_name == 'train' else 'train'
+                        print(f"⚠️  {split_name.upper()}: skipping {len(conflicts)} images earlier runs put in {other_side} "
+                              f"(SPLIT_MODE, the split ratios or SPLIT_SALT changed since)")
+                        new_paths -= conflicts
+                    if not new_paths:
+                        print(f"{split_name.upper()}: {combined_output_path} already holds {len(held_paths)} of this run's {len(run_paths)} "
+                              f"images of {iteration_name} from {source} ({len(conflicts)} conflicting skipped), skipping")
+                        continue
+                    print(f"{split_name.upper()}: appending {len(new_paths)} new images ({len(held_paths)} of this run's already in "
+                          f"{combined_output_path}, {len(conflicts)} conflicting skipped)")
+                    manifest_appends[split_name] = (record, new_paths)
+                    part_name = f"{record['parts']:04d}_{part_name}"  # Parts load in append order
+                combined_outputs[split_name] = (combined_output_path,) + open_csv_stream(combined_output_path, header, True, CSV_SEPARATOR)
+                if COLUMNAR_OUTPUT:
+                    # Columnar files can't be appended to, so each append adds its own part to the directory
+                    parts_dir = os.path.join(CSV_OUTDIR, f"{OUTPUT_SUFFIX}_{split_name}_{COLUMNAR_OUTPUT}")
+                    os.makedirs(parts_dir, exist_ok=True)
+                    columnar_output_path = os.path.join(parts_dir, f"{part_name}.{COLUMNAR_OUTPUT}")
+                    combined_columnar_outputs[split_name] = (columnar_output_path,) + open_columnar_stream(columnar_output_path, header)
         
-        # Write individual CSV files if enabled
-        if OUTPUT_INDIVIDUAL_CSV:
-            for split_name, csv_data in splits:
-                csv_output_path = os.path.join(CSV_OUTDIR, f"{input_base}_{output_suffix}_{split_name}.csv")
-                
-                with open(csv_output_path, 'w', newline='', encoding='utf-8') as f:
-                    fieldnames = [CSV_IMG_KEY, CSV_CAPTION_KEY]
-                    writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=CSV_SEPARATOR)
-                    writer.writeheader()
-                    writer.writerows(csv_data)
-                
-                print(f"{split_name.upper()} CSV: {csv_output_path} ({len(csv_data)} entries)")
+        def count_rows(split_name):
+            def count(rows):
+                row_counts[split_name] += len(rows)
+            return count
         
-        # Append to combined CSV files if enabled
-        if APPEND_TO_COMBINED:
-            for split_name, csv_data in splits:
-                combined_output_path = os.path.join(CSV_OUTDIR, f"{OUTPUT_SUFFIX}_{split_name}.csv")
-                
-                # Check if file exists to determine if we need to write header
-                file_exists = os.path.exists(combined_output_path)
-                
-                with open(combined_output_path, 'a', newline='', encoding='utf-8') as f:
-                    fieldnames = [CSV_IMG_KEY, CSV_CAPTION_KEY]
-                    writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=CSV_SEPARATOR)
-                    
-                    # Write header only if file is new
-                    if not file_exists:
-                        writer.writeheader()
-                    
-                    writer.writerows(csv_data)
-                
-                print(f"APPENDED {split_name.upper()} to: {combined_output_path} (+{len(csv_data)} entries)")
+        split_batches = []
+        for split_name, data_split in split_lists.items():
+            writes = []
+            if split_name in individual_outputs:
+                writes.append(individual_outputs[split_name][1])
+            writes.extend(write_rows for _, write_rows, _ in columnar_outputs[split_name])
+            combined_writes = [outputs[split_name][1] for outputs in (combined_outputs, combined_columnar_outputs) if split_name in outputs]
+            # Val images are drawn from test, so only train and test are counted
+            split_stats = dedup_stats if split_name != 'val' else None
+            if split_name in manifest_appends:
+                # Only the images the combined files don't hold yet are deduped, combined and written for them -
+                # the whole split is still generated, on its own, when the individual files need it
+                new_paths = manifest_appends[split_name][1]
+                new_entries = [entry for entry in data_split if expand_path(path_table, entry['image']) in new_paths]
+                if writes:
+                    split_batches.append((iter_csv_batches(new_entries, path_table, dedup), combined_writes))
+                else:
+                    split_batches.append((iter_csv_batches(new_entries, path_table, dedup, split_stats), [count_rows(split_name)] + combined_writes))
+                combined_writes = []
+            if writes or combined_writes:
+                split_batches.append((iter_csv_batches(data_split, path_table, dedup, split_stats), [count_rows(split_name)] + writes + combined_writes))
+        write_interleaved(split_batches)
+        
+        for split_name, (csv_output_path, _, close) in individual_outputs.items():
+            print(f"{split_name.upper()} CSV: {csv_output_path} ({close()} entries)")
+        for split_name, (combined_output_path, _, close) in combined_outputs.items():
+            appended_rows = close()
+            print(f"APPENDED {split_name.upper()} to: {combined_output_path} (+{appended_rows} entries)")
+            if split_name in manifest_appends:
+                record, new_paths = manifest_appends[split_name]
+                record['bytes'] = os.path.getsize(combined_output_path)
+                record['rows'] += appended_rows
+                if COLUMNAR_OUTPUT:
+                    record['parts'] += 1
+                record['images'].setdefault(iteration_name, {}).setdefault(source, []).extend(sorted(new_paths))
+        for split_name, split_columnar_outputs in columnar_outputs.items():
+            for columnar_output_path, _, close in split_columnar_outputs:
+                print(f"{split_name.upper()} {COLUMNAR_OUTPUT.upper()}: {columnar_output_path} ({close()} entries)")
+        for split_name, (columnar_output_path, _, close) in combined_columnar_outputs.items():
+            print(f"{split_name.upper()} {COLUMNAR_OUTPUT.upper()}: {columnar_output_path} ({close()} entries)")
+        if manifest_appends:
+            save_manifest(manifest)
+            print(f"Manifest: {MANIFEST_FILE}")
         
         # Print split statistics
         print(f"\n=== SPLIT STATISTICS FOR {iteration_name.upper()} ===")
-        print(f"Train: {len(train_data)} images ({len(train_csv)} caption entries)")
-        print(f"Test: {len(test_data)} images ({len(test_csv)} caption entries)")
-        print(f"Val: {len(val_data)} images ({len(val_csv)} caption entries)")
+        print(f"Train: {len(train_data)} images ({row_counts['train']} caption entries)")
+        print(f"Test: {len(test_data)} images ({row_counts['test']} caption entries)")
+        print(f"Val: {len(val_data)} images ({row_counts['val']} caption entries)")
+        if manifest is not None and not OUTPUT_INDIVIDUAL_CSV:
+            print("(caption entries count the newly appended images only)")
+        if dedup:
+            print(format_dedup_stats(dedup_stats))
         
         train_pct = len(train_data) / len(filtered_results) * 100 if filtered_results else 0
         test_pct = len(test_data) / len(filtered_results) * 100 if filtered_results else 0
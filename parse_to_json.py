@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """Parse caption data with intelligent content filtering based on [xxxx] tags"""
 
-import json
-import re
 import csv
 import os
 
+from entry_parser import build_tag_filter, materialize_lazy_entry, parse_entries
+from json_stream import open_json_output
+
 # === CONFIGURATION ===
 INPUT_FILE = "/home/cynapse/terence/database/blip/results/tqvcd_filelist_temp0_topk1_topp1_readable.txt"
 # OUTPUT_DIR = '/home/cynapse/terence/database/blip/results/blip_caption/'
@@ -13,7 +14,12 @@ INPUT_FILE = "/home/cynapse/terence/database/blip/results/tqvcd_filelist_temp0_t
 OUTPUT_DIR = '/home/cynapse/zhenyang/caption_parser/output_json/'
 CSV_OUTDIR = '/home/cynapse/zhenyang/caption_parser/output_csv/'
 VISIBILITY_THRESHOLD = 50
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
+PARSE_WORKERS = 1  # Set above 1 to parse large input files across a process pool (.gz/.zst inputs always use one)
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024  # Target size of each byte range handed to a parse worker
+FILTER_TASKS = ('Task 3', 'Task 5', 'Task 6', 'Task 7', 'Task 8')  # Tasks read by the entry checks - tag-filtered before the rest
 OUTPUT_SUFFIX = 'blip_caption_(info_damage_condition_accessories)'
+OUTPUT_FORMAT = 'json'  # 'json': one indented array; 'jsonl': JSON Lines, one record per line
 
 # === TAG FILTERING ===
 INCLUDE_TAGS = {
@@ -30,85 +36,22 @@ INCLUDE_ALL_TAGS = False
 INCLUDE_TASK_4 = False
 DEBUG_TAG_FILTERING = False
 
-def filter_tags(line):
-    """Filter content based on tag configuration - only keeps content from enabled tags"""
-    if not line:
-        return line.strip()
-    
-    if INCLUDE_ALL_TAGS:
-        return re.sub(r'\[.*?\]\s*', '', line).strip()
-    
-    tags = re.findall(r'\[.*?\]', line)
-    if not tags:
-        return line.strip()
-    
-    if DEBUG_TAG_FILTERING:
-        print(f"Original: {line} | Tags: {tags}")
-    
-    has_enabled_tag = any(tag in INCLUDE_TAGS and INCLUDE_TAGS[tag] for tag in tags)
-    if not has_enabled_tag:
-        return ''
-    
-    result_parts = []
-    parts = re.split(r'(\[.*?\])', line)
-    
-    for i, part in enumerate(parts):
-        if part.startswith('[') and part.endswith(']'):
-            tag = part
-            if tag in INCLUDE_TAGS and INCLUDE_TAGS[tag]:
-                if i + 1 < len(parts):
-                    content = parts[i + 1].strip()
-                    if content:
-                        result_parts.append(content)
-    
-    result = ' '.join(result_parts).strip()
-    
-    if DEBUG_TAG_FILTERING:
-        print(f"Filtered result: {result}")
-    
-    return result
+# Built once from the config above - call build_tag_filter again if the tag config changes at runtime
+filter_tags = build_tag_filter(INCLUDE_TAGS, INCLUDE_ALL_TAGS, DEBUG_TAG_FILTERING)
+
+def materialize_entry(lazy_entry, tasks=None):
+    """Tag-filter the requested tasks of a lazy entry (all when tasks is None) into a parse_entry style dict"""
+    return materialize_lazy_entry(lazy_entry, filter_tags, tasks)
 
 def parse_to_json(filename):
-    """Parse input file and return structured data"""
-    results = []
-    
-    with open(filename, 'r') as file:
-        content = file.read()
-    
-    entries = content.strip().split('\n\n')
-    
-    for entry in entries:
-        if not entry.strip():
-            continue
-            
-        lines = entry.strip().split('\n')
-        if not lines or ':' not in lines[0]:
-            continue
-            
-        image_path = lines[0].split(':')[0].strip()
-        entry_dict = {"image": image_path}
-        
-        current_task = None
-        current_content = []
-        
-        for line in lines[1:]:
-            line = line.strip()
-            if line.startswith('Task '):
-                if current_task:
-                    entry_dict[current_task] = current_content
-                current_task = line
-                current_content = []
-            elif line:
-                cleaned_line = filter_tags(line)
-                if cleaned_line:
-                    current_content.append(cleaned_line)
-        
-        if current_task:
-            entry_dict[current_task] = current_content
-        
-        results.append(entry_dict)
-    
-    return results
+    """Parse input file and yield structured data one entry at a time"""
+    return parse_entries(filename, (INCLUDE_TAGS, INCLUDE_ALL_TAGS, DEBUG_TAG_FILTERING),
+                         PARSE_WORKERS, READ_BUFFER_SIZE, PARSE_CHUNK_BYTES)
+
+def parse_to_json_lazy(filename):
+    """Yield lazy entries (see entry_parser.parse_entry_lazy) one at a time - pair with materialize_entry"""
+    return parse_entries(filename, (INCLUDE_TAGS, INCLUDE_ALL_TAGS, DEBUG_TAG_FILTERING),
+                         PARSE_WORKERS, READ_BUFFER_SIZE, PARSE_CHUNK_BYTES, lazy=True)
 
 def check_task5_vehicle_yes(entry_dict):
     """Check if Task 5 contains 'Vehicle: Yes'"""
@@ -141,6 +84,31 @@ def check_task8_multiple_no(entry_dict):
         return False
     return any(line.strip() == 'Multiple = no' for line in entry_dict['Task 8'])
 
+def entry_output(entry):
+    """{'image', 'caption'} output record of a passing entry - Task 1, plus Task 4 for damaged vehicles"""
+    captions = []
+    if 'Task 1' in entry:
+        captions.extend(entry['Task 1'])
+    
+    damage_level = None
+    if 'Task 3' in entry:
+        for line in entry['Task 3']:
+            if line.startswith('Damage = '):
+                value = line.split('Damage = ')[1].strip()
+                if any(level in value for level in ['Minor', 'Moderate', 'Severe']):
+                    damage_level = next(level for level in ['Minor', 'Moderate', 'Severe'] if level in value)
+                    break
+    
+    if damage_level and 'Task 4' in entry and INCLUDE_TASK_4:
+        for line in entry['Task 4']:
+            if line.strip() and line.strip().upper() != 'NA':
+                captions.append(line.strip())
+
+    return {
+        'image': entry['image'],
+        'caption': captions
+    }
+
 def main():
     print("=== TAG FILTERING CONFIGURATION ===")
     print("Content filtering based on tags (tags are always removed from output):")
@@ -151,89 +119,65 @@ def main():
     print(f"\nINCLUDE_ALL_TAGS: {INCLUDE_ALL_TAGS}")
     print("\n" + "="*50 + "\n")
     
+    input_base = INPUT_FILE.split('/')[-1].split('.')[0]
+    output_path = f"{OUTPUT_DIR}/{input_base}_{OUTPUT_SUFFIX}.{OUTPUT_FORMAT}"
+    csv_output_path = os.path.join(CSV_OUTDIR, f"{input_base}_task_checks.csv")
+    
     print(f"Parsing {INPUT_FILE}...")
-    all_results = parse_to_json(INPUT_FILE)
     
-    csv_data = []
-    filtered_results = []
+    total_count = 0
+    passing_count = 0
     
     print(f"\n=== FILTERING BY TASK 5, 6, 7, AND 8 ===")
     
-    for i, entry_dict in enumerate(all_results, 1):
-        task5_pass = check_task5_vehicle_yes(entry_dict)
-        task6_pass = check_task6_visibility_N_plus(entry_dict)
-        task7_pass = check_task7_visibility_day(entry_dict)
-        task8_pass = check_task8_multiple_no(entry_dict)
+    # Task check rows and passing entries' captions are both written as entries stream in
+    write_output, close_output = open_json_output(output_path)
+    with open(csv_output_path, 'w', newline='') as csv_file:
+        fieldnames = ['Image', 'Task 3 (Damage)', 'Task 5 (Vehicle)', 'Task 6 (Visibility)', 'Task 7 (Time)', 'Task 8 (Multiple)', 'Overall Result']
+        csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        csv_writer.writeheader()
         
-        overall_pass = all([task5_pass, task6_pass, task7_pass, task8_pass])
+        for i, lazy_entry in enumerate(parse_to_json_lazy(INPUT_FILE), 1):
+            total_count = i
+            # Only the filter tasks are tag-filtered up front - captions are built for passing entries only
+            entry_dict = materialize_entry(lazy_entry, FILTER_TASKS)
+            task5_pass = check_task5_vehicle_yes(entry_dict)
+            task6_pass = check_task6_visibility_N_plus(entry_dict)
+            task7_pass = check_task7_visibility_day(entry_dict)
+            task8_pass = check_task8_multiple_no(entry_dict)
         
-        damage_level = 'N/A'
-        if 'Task 3' in entry_dict:
-            for line in entry_dict['Task 3']:
-                if line.startswith('Damage = '):
-                    damage_level = line.split('Damage = ')[1].strip()
-                    break
+            overall_pass = all([task5_pass, task6_pass, task7_pass, task8_pass])
+        
+            damage_level = 'N/A'
+            if 'Task 3' in entry_dict:
+                for line in entry_dict['Task 3']:
+                    if line.startswith('Damage = '):
+                        damage_level = line.split('Damage = ')[1].strip()
+                        break
 
-        csv_data.append({
-            'Image': entry_dict['image'],
-            'Task 3 (Damage)': damage_level,
-            'Task 5 (Vehicle)': 'PASS' if task5_pass else 'FAIL',
-            'Task 6 (Visibility)': 'PASS' if task6_pass else 'FAIL',
-            'Task 7 (Time)': 'PASS' if task7_pass else 'FAIL',
-            'Task 8 (Multiple)': 'PASS' if task8_pass else 'FAIL',
-            'Overall Result': 'PASS' if overall_pass else 'FAIL'
-        })
+            csv_writer.writerow({
+                'Image': entry_dict['image'],
+                'Task 3 (Damage)': damage_level,
+                'Task 5 (Vehicle)': 'PASS' if task5_pass else 'FAIL',
+                'Task 6 (Visibility)': 'PASS' if task6_pass else 'FAIL',
+                'Task 7 (Time)': 'PASS' if task7_pass else 'FAIL',
+                'Task 8 (Multiple)': 'PASS' if task8_pass else 'FAIL',
+                'Overall Result': 'PASS' if overall_pass else 'FAIL'
+            })
         
-        if overall_pass:
-            filtered_results.append(entry_dict)
+            if overall_pass:
+                write_output(entry_output(materialize_entry(lazy_entry)))
+                passing_count += 1
     
     print(f"=== SUMMARY ===")
-    print(f"Total entries: {len(all_results)} | Passing: {len(filtered_results)}")
+    print(f"Total entries: {total_count} | Passing: {passing_count}")
     
-    # Build output
-    output_list = []
-    for entry in filtered_results:
-        captions = []
-        if 'Task 1' in entry:
-            captions.extend(entry['Task 1'])
-        
-        damage_level = None
-        if 'Task 3' in entry:
-            for line in entry['Task 3']:
-                if line.startswith('Damage = '):
-                    value = line.split('Damage = ')[1].strip()
-                    if any(level in value for level in ['Minor', 'Moderate', 'Severe']):
-                        damage_level = next(level for level in ['Minor', 'Moderate', 'Severe'] if level in value)
-                        break
-        
-
-        if damage_level and 'Task 4' in entry and INCLUDE_TASK_4:
-            for line in entry['Task 4']:
-                if line.strip() and line.strip().upper() != 'NA':
-                    captions.append(line.strip())
-
-        output_list.append({
-            'image': entry['image'],
-            'caption': captions
-        })
-
     # Write outputs
-    input_base = INPUT_FILE.split('/')[-1].split('.')[0]
-    output_path = f"{OUTPUT_DIR}/{input_base}_{OUTPUT_SUFFIX}.json"
-    csv_output_path = os.path.join(CSV_OUTDIR, f"{input_base}_task_checks.csv")
-    
-    with open(output_path, 'w') as f:
-        json.dump(output_list, f, indent=2)
+    close_output()
     print(f"JSON output: {output_path}")
-    
-    with open(csv_output_path, 'w', newline='') as f:
-        fieldnames = ['Image', 'Task 3 (Damage)', 'Task 5 (Vehicle)', 'Task 6 (Visibility)', 'Task 7 (Time)', 'Task 8 (Multiple)', 'Overall Result']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(csv_data)
     print(f"CSV output: {csv_output_path}")
 
-    return filtered_results
+    return passing_count
 
 if __name__ == "__main__":
     main()
@@ -5,21 +5,17 @@ import re
 import csv
 import os
 
+from entry_parser import iter_entry_blocks
+
 # === CONFIGURATION ===
 INPUT_FILE = '/home/cynapse/zhenyang/caption_parser/caption_input_txt/example_prompt_output_long'  # Change to your input file
 OUTPUT_DIR = './output_json'  # Change to your desired output directory
 VISIBILITY_THRESHOLD = 45
+READ_BUFFER_SIZE = 1024 * 1024  # Bytes buffered per read when streaming input files
 
 def parse_to_dict(filename):
-    results = []
-    
-    with open(filename, 'r') as file:
-        content = file.read()
-    
-    # Split by empty lines to separate different entries
-    entries = content.strip().split('\n\n')
-    
-    for entry_idx, entry in enumerate(entries, 1):
+    # Entries are separated by empty lines and yielded one at a time
+    for entry_idx, entry in enumerate(iter_entry_blocks(filename, READ_BUFFER_SIZE), 1):
         if not entry.strip():
             continue
             
@@ -61,13 +57,11 @@ def parse_to_dict(filename):
         if current_task:
             entry_dict[current_task] = current_content
         
-        results.append(entry_dict)
-        
         # Print the dictionary for this entry
         # print(f"\n=== Entry {entry_idx}: {image_path} ===")
         # print(json.dumps(entry_dict, indent=2))
-    
-    return results
+        
+        yield entry_dict
 
 def check_task5_vehicle_yes(entry_dict):
     """
@@ -139,16 +133,14 @@ def main():
     input_file = INPUT_FILE
     
     print(f"Parsing {input_file} using space separation...")
-    all_results = parse_to_dict(input_file)
-    
-    # Initialize CSV data list
-    csv_data = []
+    total_count = 0
     
     print(f"\n\n=== FILTERING BY TASK 5, 6, 7, AND 8 ===")
     
     # Filter entries based on Task 5, 6, 7, and 8 checks
     filtered_results = []
-    for i, entry_dict in enumerate(all_results, 1):
+    for i, entry_dict in enumerate(parse_to_dict(input_file), 1):
+        total_count = i
         task5_pass = check_task5_vehicle_yes(entry_dict)
         task6_pass = check_task6_visibility_N_plus(entry_dict)
         task7_pass = check_task7_visibility_day(entry_dict)
@@ -172,7 +164,7 @@ def main():
         print()
     
     print(f"\n=== SUMMARY ===")
-    print(f"Total entries parsed: {len(all_results)}")
+    print(f"Total entries parsed: {total_count}")
     print(f"Entries passing all filters: {len(filtered_results)}")
 
     # Set output directory as a variable
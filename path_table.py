@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Interned image path table - directory prefixes plus basenames, referenced by integer path IDs"""
+
+from array import array
+
+def new_path_table():
+    """Empty path table; path IDs are assigned 0, 1, 2... in first-seen order"""
+    return {
+        'prefixes': [],  # Directory prefix strings (with trailing '/'), shared by every path under them
+        'prefix_ids': {},
+        'basename_ids': [],  # Per prefix: basename -> path ID
+        'path_prefixes': array('i'),  # Per path ID: prefix ID
+        'basenames': []  # Per path ID: basename string
+    }
+
+def intern_path(table, image_path):
+    """Integer ID of an image path, adding it to the table on first sight"""
+    split = image_path.rfind('/') + 1
+    prefix = image_path[:split]
+
+    prefix_id = table['prefix_ids'].get(prefix)
+    if prefix_id is None:
+        prefix_id = len(table['prefixes'])
+        table['prefixes'].append(prefix)
+        table['prefix_ids'][prefix] = prefix_id
+        table['basename_ids'].append({})
+
+    basename_ids = table['basename_ids'][prefix_id]
+    basename = image_path[split:]
+    path_id = basename_ids.get(basename)
+    if path_id is None:
+        path_id = len(table['basenames'])
+        basename_ids[basename] = path_id
+        table['path_prefixes'].append(prefix_id)
+        table['basenames'].append(basename)
+    return path_id
+
+def expand_path(table, path_id):
+    """Full image path string of a path ID"""
+    return table['prefixes'][table['path_prefixes'][path_id]] + table['basenames'][path_id]
+
+def table_stats(table):
+    """(paths, prefixes, bytes of path text held by the table, bytes the same paths take as full strings)"""
+    prefix_bytes = [len(prefix.encode('utf-8')) for prefix in table['prefixes']]
+    basename_bytes = sum(len(basename.encode('utf-8')) for basename in table['basenames'])
+    full_bytes = basename_bytes + sum(prefix_bytes[prefix_id] for prefix_id in table['path_prefixes'])
+    return len(table['basenames']), len(table['prefixes']), sum(prefix_bytes) + basename_bytes, full_bytes
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Parse and filter a readable file once, fanning every entry out to the configured output sinks"""
+
+import csv
+import json
+import os
+
+from parse_to_json import parse_to_json_lazy, materialize_entry, FILTER_TASKS, INCLUDE_TAGS, INCLUDE_ALL_TAGS
+from caption_combine import combine_captions
+from caption_dedup import dedup_captions_batch, format_dedup_stats, new_dedup_stats
+from columnar_output import columnar_path, open_columnar_stream
+from csv_stream import open_csv_stream, write_interleaved
+from json_stream import open_json_array
+from parse_to_csv import split_data
+from path_table import expand_path, intern_path, new_path_table
+from split_assign import SPLIT_NAMES, add_stratified, assign_split, entry_stratum, finish_stratified, format_stratum_report, new_stratified_splitter
+from webdataset_shards import format_shard_report, open_shard_stream
+from task_index import extract_task_fields
+
+# === CONFIGURATION ===
+INPUT_FILE = "/home/cynapse/terence/database/blip/results/tqvcd_filelist_temp0_topk1_topp1_readable.txt"
+OUTPUT_DIR = '/home/cynapse/zhenyang/caption_parser/output_json/'
+CSV_OUTDIR = '/home/cynapse/zhenyang/caption_parser/output_csv/'
+VISIBILITY_THRESHOLD = 50  # Task 6 threshold of the sinks standing in for parse_to_json.py and parse_to_csv.py
+INCLUDE_TASK_4 = False
+
+# Task 6 check of the sinks standing in for scripts with their own, as (threshold, rule): 'first' passes on the
+# first parseable Visibility line, as parse_to_json.py does; 'any' on any line at or above the threshold
+SINK_VISIBILITY_RULES = {
+    'task5_json': (45, 'any'),  # parse_to_json_task_5.py
+    'damage_buckets': (45, 'any'),  # categorize_damage.py
+}
+IMAGE_HEADER_SUFFIXES = ('.png:', '.jpg:')  # parse_to_json_task_5.py and categorize_damage.py skip entries without one
+
+# Sinks to run - any subset of:
+#   'filtered_json'   - passing entries with their captions (parse_to_json.py)
+#   'task_checks_csv' - per-task PASS/FAIL for every entry (parse_to_json.py)
+#   'task5_json'      - Task 5 vehicle attributes of passing entries (parse_to_json_task_5.py)
+#   'damage_buckets'  - passing images grouped by Task 3 damage level (categorize_damage.py)
+#   'training_csv'    - train/test/val caption CSVs (parse_to_csv.py)
+SINKS = ['filtered_json', 'task_checks_csv', 'task5_json', 'damage_buckets', 'training_csv']
+
+JSON_OUTPUT_SUFFIX = 'blip_caption_(info_damage_condition_accessories)'
+
+# === TRAINING CSV OPTIONS ===
+TRAINING_CSV_SUFFIX = 'combined_blip_caption_csv'
+MAX_WORDS = 30
+COMBINE_CAPTIONS = True
+COMBINE_SEED = 0  # Seed of the per-image caption shuffle - same seed and image give the same combined captions
+COMBINE_MODE = 'words'  # 'words': even groups of about MAX_WORDS words; 'tokens': fewest rows that each fit TOKEN_BUDGET
+TOKEN_BUDGET = 75  # CLIP text tokens per combined caption (77-token context minus start/end tokens)
+CAPTION_TOKENIZER = None  # None estimates token counts; a Hugging Face CLIP tokenizer name (needs transformers) counts exactly
+DEDUP_CAPTIONS = False  # Drop near-duplicate captions within each image (MinHash/LSH) before combining
+DEDUP_THRESHOLD = 0.6  # Jaccard similarity of two captions' content words at which the shorter one is dropped
+TRAIN_RATIO = 0.8
+VAL_RATIO = 0.2
+SPLIT_MODE = 'hash'  # 'hash': each image's split follows a stable hash of its path (same on re-runs and appends); 'stratified': exact ratios per (damage, source, camera folder), small folders pooled per (damage, source); 'random': reshuffle every run
+SPLIT_SALT = ''  # Change to draw a different, but again stable, hash split
+CSV_IMG_KEY = 'image_path'
+CSV_CAPTION_KEY = 'caption'
+CSV_SEPARATOR = ','
+CSV_COMPRESS = False  # Write .csv.gz training splits, gzip-compressed on the writer threads
+CSV_BATCH_IMAGES = 4096  # Images whose rows are generated and handed to the writers at a time
+COLUMNAR_OUTPUT = None  # 'parquet' or 'arrow' (Arrow IPC) to also write each training split next to its CSV
+WEBDATASET_SHARDS = False  # Also pack each split's images and captions into WebDataset tar shards, for sequential reads when training
+IMAGE_BASE_DIR = '/home/cynapse/terence/database/blip/'  # Image paths are relative to this when packing shards
+
+DAMAGE_LEVELS = ['Minor', 'Moderate', 'Severe']
+TASK_CHECK_FIELDS = ['Image', 'Task 3 (Damage)', 'Task 5 (Vehicle)', 'Task 6 (Visibility)', 'Task 7 (Time)', 'Task 8 (Multiple)', 'Overall Result']
+
+def sink_visibility_rule(sink_name):
+    """(threshold, rule) of a sink's Task 6 check - see SINK_VISIBILITY_RULES"""
+    return SINK_VISIBILITY_RULES.get(sink_name, (VISIBILITY_THRESHOLD, 'first'))
+
+def visibility_passes(entry_dict, first_visibility, threshold, rule):
+    """Task 6 check under one (threshold, rule)"""
+    if rule == 'first':
+        return first_visibility is not None and first_visibility >= threshold
+    for line in entry_dict.get('Task 6', []):
+        if line.strip().startswith("Visibility = "):
+            try:
+                if int(line.strip().split("= ")[1]) >= threshold:
+                    return True
+            except (ValueError, IndexError):
+                continue
+    return False
+
+def check_entry(entry_dict, visibility_rules=()):
+    """Run the Task 5-8 checks once and package the results every sink reads from
+
+    'checks' and 'passed' use the default Task 6 rule; 'passed_under' holds the overall result under each of
+    visibility_rules as well.
+    """
+    fields = extract_task_fields(entry_dict)
+    default_rule = sink_visibility_rule(None)
+    checks = {
+        'Task 5 (Vehicle)': fields['vehicle_yes'],
+        'Task 6 (Visibility)': visibility_passes(entry_dict, fields['visibility'], *default_rule),
+        'Task 7 (Time)': fields['time_day'],
+        'Task 8 (Multiple)': fields['multiple_no']
+    }
+    other_tasks_pass = fields['vehicle_yes'] and fields['time_day'] and fields['multiple_no']
+    passed_under = {default_rule: all(checks.values())}
+    for rule in visibility_rules:
+        if rule not in passed_under:
+            passed_under[rule] = other_tasks_pass and visibility_passes(entry_dict, fields['visibility'], *rule)
+    return {
+        'entry': entry_dict,
+        'checks': checks,
+        'passed': passed_under[default_rule],
+        'passed_under': passed_under,
+        'damage_values': fields['damage_values']
+    }
+
+def filtered_json_sink(input_base):
+    """Passing entries with Task 1 captions, plus Task 4 for damaged vehicles when INCLUDE_TASK_4 is set"""
+    output_path = os.path.join(OUTPUT_DIR, f"{input_base}_{JSON_OUTPUT_SUFFIX}.json")
+    write, close = open_json_array(output_path)
+
+    def consume(record):
+        if not record['passed']:
+            return
+        entry = record['entry']
+        captions = list(entry.get('Task 1', []))
+        damaged = any(level in value for value in record['damage_values'] for level in DAMAGE_LEVELS)
+        if damaged and 'Task 4' in entry and INCLUDE_TASK_4:
+            for line in entry['Task 4']:
+                if line.strip() and line.strip().upper() != 'NA':
+                    captions.append(line.strip())
+        write({'image': entry['image'], 'caption': captions})
+
+    def finish():
+        print(f"JSON output: {output_path} ({close()} entries)")
+
+    return {'consume': consume, 'finish': finish}
+
+def task_checks_csv_sink(input_base):
+    """One PASS/FAIL row per parsed entry"""
+    output_path = os.path.join(CSV_OUTDIR, f"{input_base}_task_checks.csv")
+    f = open(output_path, 'w', newline='')
+    writer = csv.DictWriter(f, fieldnames=TASK_CHECK_FIELDS)
+    writer.writeheader()
+
+    def consume(record):
+        row = {
+            'Image': record['entry']['image'],
+            'Task 3 (Damage)': record['damage_values'][0] if record['damage_values'] else 'N/A',
+            'Overall Result': 'PASS' if record['passed'] else 'FAIL'
+        }
+        for task, passed in record['checks'].items():
+            row[task] = 'PASS' if passed else 'FAIL'
+        writer.writerow(row)
+
+    def finish():
+        f.close()
+        print(f"CSV output: {output_path}")
+
+    return {'consume': consume, 'finish': finish}
+
+def task5_json_sink(input_base):
+    """Task 5 'Key: Value' attributes of passing entries"""
+    output_path = os.path.join(OUTPUT_DIR, f"{input_base}_task_5.json")
+    write, close = open_json_array(output_path)
+    visibility_rule = sink_visibility_rule('task5_json')
+
+    def consume(record):
+        if not (record['image_header'] and record['passed_under'][visibility_rule]):
+            return
+        entry = record['entry']
+        entry_data = {'image': entry['image']}
+        for info in entry.get('Task 5', []):
+            parts = [part.strip() for part in info.split(':')]
+            if len(parts) == 2:
+                entry_data[parts[0]] = parts[1]
+        write(entry_data)
+
+    def finish():
+        print(f"Task 5 output: {output_path} ({close()} entries)")
+
+    return {'consume': consume, 'finish': finish}
+
+def damage_buckets_sink(input_base):
+    """Passing image paths grouped by the first Task 3 damage value that names a level"""
+    output_path = os.path.join(OUTPUT_DIR, f"{input_base}_damage_buckets.json")
+    buckets = {level: [] for level in DAMAGE_LEVELS + ['None']}
+    visibility_rule = sink_visibility_rule('damage_buckets')
+
+    def consume(record):
+        if not (record['image_header'] and record['passed_under'][visibility_rule]):
+            return
+        for value in record['damage_values']:
+            level = next((level for level in buckets if level in value), None)
+            if level:
+                buckets[level].append(record['entry']['image'])
+                return
+
+    def finish():
+        with open(output_path, 'w') as f:
+            json.dump(buckets, f, indent=2)
+        counts = ', '.join(f"{level}: {len(images)}" for level, images in buckets.items())
+        print(f"Damage buckets: {output_path} ({counts})")
+
+    return {'consume': consume, 'finish': finish}
+
+def training_csv_sink(input_base):
+    """Train/test/val caption CSVs - keeps only passing images' captions until the CSVs are written at the end"""
+    survivors = []
+    split_survivors = {split_name: [] for split_name in SPLIT_NAMES}  # Hash splits are assigned as entries stream in
+    splitter = new_stratified_splitter(TRAIN_RATIO, VAL_RATIO, SPLIT_SALT)  # Stratified ones once every stratum's size is known
+    path_table = new_path_table()
+
+    def consume(record):
+        if not record['passed']:
+            return
+        entry = record['entry']
+        captions = list(entry.get('Task 1', []))
+        if record['damage_values'] and 'Task 4' in entry and INCLUDE_TASK_4:
+            for line in entry['Task 4']:
+                if line.strip() and line.strip().upper() != 'NA':
+                    captions.append(line.strip())
+        survivor = (intern_path(path_table, entry['image']), captions)
+        if SPLIT_MODE == 'hash':
+            for split_name in assign_split(entry['image'], TRAIN_RATIO, VAL_RATIO, SPLIT_SALT):
+                split_survivors[split_name].append(survivor)
+        elif SPLIT_MODE == 'stratified':
+            add_stratified(splitter, entry_stratum(entry, input_base, entry['image']), entry['image'], survivor)
+        else:
+            survivors.append(survivor)
+
+    def finish():
+        dedup_stats = new_dedup_stats()
+        if SPLIT_MODE == 'hash':
+            data_splits = [split_survivors[split_name] for split_name in SPLIT_NAMES]
+        elif SPLIT_MODE == 'stratified':
+            data_splits = finish_stratified(splitter)
+            print(format_stratum_report(splitter))
+        else:
+            data_splits = split_data(survivors, TRAIN_RATIO, VAL_RATIO)
+        split_images = dict(zip(SPLIT_NAMES, data_splits))
+
+        def iter_csv_batches(data_split, dedup_stats=None):
+            for batch_start in range(0, len(data_split), CSV_BATCH_IMAGES):
+                batch = data_split[batch_start:batch_start + CSV_BATCH_IMAGES]
+                image_captions = [(expand_path(path_table, path_id), captions) for path_id, captions in batch]
+                if DEDUP_CAPTIONS:
+                    image_captions = dedup_captions_batch(image_captions, DEDUP_THRESHOLD, dedup_stats)
+                if COMBINE_CAPTIONS:
+                    combined = combine_captions(image_captions, COMBINE_MODE, MAX_WORDS, TOKEN_BUDGET, CAPTION_TOKENIZER, COMBINE_SEED)
+                    image_captions = [(image_path, captions) for (image_path, _), captions in zip(image_captions, combined)]
+                yield [(image_path, caption) for image_path, captions in image_captions for caption in captions]
+
+        # All three splits stream side by side, each file written by its own thread
+        csv_extension = '.csv.gz' if CSV_COMPRESS else '.csv'
+        outputs = {}
+        columnar_outputs = {}
+        shard_outputs = {}
+        split_batches = []
+        for split_name in SPLIT_NAMES:
+            output_path = os.path.join(CSV_OUTDIR, f"{TRAINING_CSV_SUFFIX}_{split_name}{csv_extension}")
+            outputs[split_name] = (output_path,) + open_csv_stream(output_path, (CSV_IMG_KEY, CSV_CAPTION_KEY), False, CSV_SEPARATOR)
+            writes = [outputs[split_name][1]]
+            if COLUMNAR_OUTPUT:
+                columnar_output_path = columnar_path(output_path, COLUMNAR_OUTPUT)
+                columnar_outputs[split_name] = (columnar_output_path,) + open_columnar_stream(columnar_output_path, (CSV_IMG_KEY, CSV_CAPTION_KEY))
+                writes.append(columnar_outputs[split_name][1])
+            if WEBDATASET_SHARDS:
+                shards_name = f"{TRAINING_CSV_SUFFIX}_{split_name}"
+                shards_dir = os.path.join(CSV_OUTDIR, f"{shards_name}_shards")
+                shard_outputs[split_name] = (shards_dir, shards_name) + open_shard_stream(shards_dir, shards_name, IMAGE_BASE_DIR)
+                writes.append(shard_outputs[split_name][2])
+            # Val images are drawn from test, so only train and test are counted
+            split_batches.append((iter_csv_batches(split_images[split_name], dedup_stats if split_name != 'val' else None), writes))
+        write_interleaved(split_batches)
+        for split_name, (output_path, _, close) in outputs.items():
+            print(f"{split_name.upper()} CSV: {output_path} ({len(split_images[split_name])} images, {close()} entries)")
+        for split_name, (columnar_output_path, _, close) in columnar_outputs.items():
+            print(f"{split_name.upper()} {COLUMNAR_OUTPUT.upper()}: {columnar_output_path} ({close()} entries)")
+        for split_name, (shards_dir, shards_name, _, close) in shard_outputs.items():
+            print(f"{split_name.upper()} SHARDS: {format_shard_report(shards_dir, shards_name, close())}")
+        if DEDUP_CAPTIONS:
+            print(format_dedup_stats(dedup_stats))
+
+    return {'consume': consume, 'finish': finish}
+
+SINK_FACTORIES = {
+    'filtered_json': filtered_json_sink,
+    'task_checks_csv': task_checks_csv_sink,
+    'task5_json': task5_json_sink,
+    'damage_buckets': damage_buckets_sink,
+    'training_csv': training_csv_sink
+}
+
+def run_pipeline(input_file, sink_names):
+    """Parse and check each entry once, handing the result to every sink"""
+    input_base = input_file.split('/')[-1].split('.')[0]
+    sinks = [SINK_FACTORIES[name](input_base) for name in sink_names]
+    visibility_rules = {sink_visibility_rule(name) for name in sink_names}
+
+    total_count = 0
+    passed_count = 0
+    for lazy_entry in parse_to_json_lazy(input_file):
+        record = check_entry(materialize_entry(lazy_entry, FILTER_TASKS), visibility_rules)
+        record['image_header'] = lazy_entry['lines'][0].endswith(IMAGE_HEADER_SUFFIXES)
+        if any(record['passed_under'].values()):
+            # Caption tasks are only tag-filtered for entries some sink will actually write out
+            record['entry'] = materialize_entry(lazy_entry)
+        total_count += 1
+        passed_count += record['passed']
+        for sink in sinks:
+            sink['consume'](record)
+
+    print(f"=== SUMMARY ===")
+    print(f"Total entries: {total_count} | Passing: {passed_count}")
+    for sink in sinks:
+        sink['finish']()
+
+def main():
+    print("=== TAG FILTERING CONFIGURATION (from parse_to_json.py) ===")
+    for tag, include in INCLUDE_TAGS.items():
+        status = "✅ KEEP content" if include else "❌ REMOVE content"
+        print(f"  {tag}: {status}")
+    print(f"\nINCLUDE_ALL_TAGS: {INCLUDE_ALL_TAGS}")
+    print(f"Sinks: {', '.join(SINKS)}")
+    print("\n" + "="*50 + "\n")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(CSV_OUTDIR, exist_ok=True)
+
+    print(f"Parsing {INPUT_FILE}...")
+    run_pipeline(INPUT_FILE, SINKS)
+
+if __name__ == "__main__":
+    main()
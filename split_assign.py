@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Train/test/val assignment - stable per-image path hashes, or exact ratios per stratum from hash-ordered systematic picks"""
+
+import hashlib
+import os
+
+# === CONFIGURATION ===
+SPLIT_SALT = ''  # Change to draw a different (but again stable) assignment
+SPLIT_NAMES = ('train', 'test', 'val')
+SPLIT_MODES = ('hash', 'stratified', 'random')
+MIN_FOLDER_STRATUM = 20  # Images of one (damage, source) pair a camera folder needs to be split as its own stratum
+POOLED_FOLDERS = '(smaller folders)'  # Folder name of a (damage, source) stratum's pooled small folders
+
+def split_position(image_path, salt=SPLIT_SALT):
+    """Position of an image path in [0, 1), the same on every run and machine"""
+    digest = hashlib.blake2b(f"{salt}\0{image_path}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+def assign_split(image_path, train_ratio, val_ratio, salt=SPLIT_SALT):
+    """Splits an image belongs to: ('train',), ('test',) or ('test', 'val') - val is drawn from test, as in split_data"""
+    position = split_position(image_path, salt)
+    if position < train_ratio or train_ratio >= 1:
+        return ('train',)
+    # The first val_ratio of the test range is also val
+    if (position - train_ratio) / (1 - train_ratio) < val_ratio:
+        return ('test', 'val')
+    return ('test',)
+
+def iter_split_assignments(records, train_ratio, val_ratio, image_key, salt=SPLIT_SALT):
+    """Yield (split names, record) for each record as it streams past - nothing is held back"""
+    for record in records:
+        yield assign_split(image_key(record), train_ratio, val_ratio, salt), record
+
+def hash_split_data(data, train_ratio, val_ratio, image_key, salt=SPLIT_SALT):
+    """Drop-in for split_data: (train, test, val) lists in input order, each record placed by its image path hash"""
+    splits = {split_name: [] for split_name in SPLIT_NAMES}
+    for split_names, record in iter_split_assignments(data, train_ratio, val_ratio, image_key, salt):
+        for split_name in split_names:
+            splits[split_name].append(record)
+    return splits['train'], splits['test'], splits['val']
+
+def entry_damage_level(entry_dict):
+    """Damage level named by an entry's Task 3 'Damage = ' line, 'N/A' without one"""
+    for line in entry_dict.get('Task 3', []):
+        if line.startswith('Damage = '):
+            return line.split('Damage = ')[1].strip()
+    return 'N/A'
+
+def entry_stratum(entry_dict, source, image_path):
+    """Finest stratum of a passing entry: (damage level, source model, camera folder)"""
+    return entry_damage_level(entry_dict), source, os.path.dirname(image_path) or '.'
+
+def new_stratified_splitter(train_ratio, val_ratio, salt=SPLIT_SALT):
+    """Empty stratified splitter - records are queued with add_stratified and assigned by finish_stratified"""
+    return {'train_ratio': train_ratio, 'val_ratio': val_ratio, 'salt': salt, 'records': [], 'strata': {}}
+
+def add_stratified(splitter, stratum, image_path, record):
+    """Queue a record under its entry_stratum - splits are only drawn once every stratum's size is known"""
+    splitter['records'].append((stratum, image_path, record))
+
+def systematic_picks(count, ratio, offset):
+    """Which of count ordered records to pick: count * ratio of them, rounded up or down by the offset, at even steps"""
+    return [int((i + 1) * ratio + offset) > int(i * ratio + offset) for i in range(count)]
+
+def finish_stratified(splitter):
+    """(train, test, val) lists in input order, with the target ratios met within every final stratum
+
+    Each image is split once, in the stratum of its first record, and every record of it (e.g. one per source)
+    follows. A camera folder keeps its own stratum only with MIN_FOLDER_STRATUM images of a (damage, source) pair;
+    smaller folders are pooled per (damage, source), so rare damage levels are still split as a whole. Within a
+    stratum, images are ordered by their path hash and picked at even steps from a hashed offset, so a stratum's
+    left-over image goes to any split with the right odds instead of always to train.
+    """
+    image_strata = {}
+    for stratum, image_path, _ in splitter['records']:
+        image_strata.setdefault(image_path, stratum)
+    folder_sizes = {}
+    for stratum in image_strata.values():
+        folder_sizes[stratum] = folder_sizes.get(stratum, 0) + 1
+
+    members = {}
+    for image_path, stratum in image_strata.items():
+        if folder_sizes[stratum] < MIN_FOLDER_STRATUM:
+            stratum = stratum[:2] + (POOLED_FOLDERS,)
+        members.setdefault(stratum, []).append((split_position(image_path, splitter['salt']), image_path))
+
+    image_splits = {}
+    for stratum, stratum_images in members.items():
+        stratum_images.sort()
+        # Offsets leave out the source, so the same images from another caption model are split the same way
+        key = f"{stratum[0]}\0{stratum[2]}"
+        train_picks = systematic_picks(len(stratum_images), splitter['train_ratio'], split_position(f"train\0{key}", splitter['salt']))
+        test_images = [image_path for (_, image_path), train in zip(stratum_images, train_picks) if not train]
+        val_picks = systematic_picks(len(test_images), splitter['val_ratio'], split_position(f"val\0{key}", splitter['salt']))
+        for (_, image_path), train in zip(stratum_images, train_picks):
+            if train:
+                image_splits[image_path] = ('train',)
+        for image_path, val in zip(test_images, val_picks):
+            image_splits[image_path] = ('test', 'val') if val else ('test',)
+        splitter['strata'][stratum] = {'seen': len(stratum_images), 'train': sum(train_picks),
+                                       'test': len(test_images), 'val': sum(val_picks)}
+
+    splits = {split_name: [] for split_name in SPLIT_NAMES}
+    for _, image_path, record in splitter['records']:
+        for split_name in image_splits[image_path]:
+            splits[split_name].append(record)
+    splitter['records'] = []
+    return splits['train'], splits['test'], splits['val']
+
+def stratified_split_data(data, train_ratio, val_ratio, stratum_of, image_key, salt=SPLIT_SALT):
+    """(train, test, val, splitter) with target ratios met within every stratum"""
+    splitter = new_stratified_splitter(train_ratio, val_ratio, salt)
+    for record in data:
+        add_stratified(splitter, stratum_of(record), image_key(record), record)
+    return finish_stratified(splitter) + (splitter,)
+
+def format_stratum_report(splitter):
+    """Realized split shares of every damage level, summed over its strata, largest first"""
+    levels = {}
+    for stratum, counts in splitter['strata'].items():
+        level = levels.setdefault(stratum[0], dict.fromkeys(('strata', 'seen') + SPLIT_NAMES, 0))
+        level['strata'] += 1
+        for name, count in counts.items():
+            level[name] += count
+    lines = [f"=== REALIZED RATIOS BY DAMAGE LEVEL - {len(splitter['strata'])} strata of (damage, source, camera folder), "
+             f"folders under {MIN_FOLDER_STRATUM} images pooled per (damage, source) - "
+             f"target Train: {splitter['train_ratio'] * 100:.1f}%, Val: {splitter['val_ratio'] * 100:.1f}% of test ==="]
+    for level_name, counts in sorted(levels.items(), key=lambda item: -item[1]['seen']):
+        val_share = counts['val'] / counts['test'] * 100 if counts['test'] else 0.0
+        lines.append(f"  {level_name}: {counts['seen']} images in {counts['strata']} strata - "
+                     f"Train: {counts['train'] / counts['seen'] * 100:.1f}%, "
+                     f"Test: {counts['test'] / counts['seen'] * 100:.1f}%, Val: {val_share:.1f}% of test")
+    return '\n'.join(lines)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Columnar index of the Task 3/5/6/7/8 fields for vectorized filtering of a parsed corpus"""
+
+from array import array
+
+import numpy as np
+
+# === CONFIGURATION ===
+NO_DAMAGE_CODE = -1  # Damage code for entries without a 'Damage = ' line in Task 3
+
+def extract_task_fields(entry_dict):
+    """Pull the filter fields out of one entry, matching the check_task* functions line for line"""
+    visibility = None
+    for line in entry_dict.get('Task 6', []):
+        if line.strip().startswith("Visibility = "):
+            try:
+                visibility = int(line.strip().split("= ")[1])
+                break
+            except (ValueError, IndexError):
+                continue
+
+    # Every damage value is kept because a damage filter accepts a match on any of them
+    damage_values = tuple(
+        line.split('Damage = ')[1].strip()
+        for line in entry_dict.get('Task 3', [])
+        if line.startswith('Damage = ')
+    )
+
+    return {
+        'visibility': visibility,
+        'damage_values': damage_values,
+        'vehicle_yes': any(line.strip() == 'Vehicle: Yes' for line in entry_dict.get('Task 5', [])),
+        'time_day': any(line.strip() == 'Time = day' for line in entry_dict.get('Task 7', [])),
+        'multiple_no': any(line.strip() == 'Multiple = no' for line in entry_dict.get('Task 8', []))
+    }
+
+def build_task_index(entries):
+    """Build the columnar index in a single pass over parsed entries"""
+    visibility = array('q')
+    has_visibility = array('b')
+    damage_codes = array('i')
+    vehicle_yes = array('b')
+    time_day = array('b')
+    multiple_no = array('b')
+    # Damage values are dictionary-encoded - a corpus only has a handful of distinct ones
+    damage_categories = {}
+
+    for entry_dict in entries:
+        fields = extract_task_fields(entry_dict)
+        visibility.append(fields['visibility'] if fields['visibility'] is not None else 0)
+        has_visibility.append(fields['visibility'] is not None)
+        if fields['damage_values']:
+            code = damage_categories.setdefault(fields['damage_values'], len(damage_categories))
+        else:
+            code = NO_DAMAGE_CODE
+        damage_codes.append(code)
+        vehicle_yes.append(fields['vehicle_yes'])
+        time_day.append(fields['time_day'])
+        multiple_no.append(fields['multiple_no'])
+
+    return {
+        'visibility': np.frombuffer(visibility, dtype=np.int64),
+        'has_visibility': np.frombuffer(has_visibility, dtype=np.int8).astype(bool),
+        'damage_codes': np.frombuffer(damage_codes, dtype=np.int32),
+        'damage_categories': list(damage_categories),
+        'vehicle_yes': np.frombuffer(vehicle_yes, dtype=np.int8).astype(bool),
+        'time_day': np.frombuffer(time_day, dtype=np.int8).astype(bool),
+        'multiple_no': np.frombuffer(multiple_no, dtype=np.int8).astype(bool)
+    }
+
+def visibility_mask(task_index, threshold):
+    """Task 6 pass mask for a visibility threshold"""
+    return task_index['has_visibility'] & (task_index['visibility'] >= threshold)
+
+def damage_mask(task_index, damage_filter):
+    """Task 3 pass mask for a damage filter, a case-insensitive substring match against any of an entry's damage values"""
+    lowered_filter = [x.lower() for x in damage_filter]
+    category_pass = [
+        any(x in value.lower() for value in damage_values for x in lowered_filter)
+        for damage_values in task_index['damage_categories']
+    ]
+    # Trailing False is picked up by NO_DAMAGE_CODE (-1)
+    category_pass = np.array(category_pass + [False], dtype=bool)
+    return category_pass[task_index['damage_codes']]
+
+def task_check_masks(task_index, visibility_threshold, damage_filter=None):
+    """Per-task pass masks across the whole corpus, keyed like the task check CSV columns"""
+    masks = {
+        'Task 5 (Vehicle)': task_index['vehicle_yes'],
+        'Task 6 (Visibility)': visibility_mask(task_index, visibility_threshold),
+        'Task 7 (Time)': task_index['time_day'],
+        'Task 8 (Multiple)': task_index['multiple_no']
+    }
+    if damage_filter is not None:
+        masks['Task 3 (Damage)'] = damage_mask(task_index, damage_filter)
+    return masks
+
+def overall_pass_mask(task_index, visibility_threshold, damage_filter=None):
+    """Combined pass mask for Tasks 5-8, plus Task 3 when a damage filter is given"""
+    masks = list(task_check_masks(task_index, visibility_threshold, damage_filter).values())
+    return np.logical_and.reduce(masks)
@@ -0,0 +1,125 @@
+"""Every pipeline.py sink against the standalone script it stands in for, on the example input and on edge cases"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import categorize_damage
+import parse_to_csv
+import parse_to_json
+import parse_to_json_task_5
+import pipeline
+
+EXAMPLE_INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'caption_input_txt', 'example_prompt_output_long')
+
+def edge_entry(image_header, damage, visibility_lines):
+    """One readable entry that passes Tasks 5, 7 and 8, with the given Task 3 damage and Task 6 lines"""
+    return '\n'.join([
+        image_header,
+        'Task 1', '[Info] White sedan', '[Damage] Dented front bumper', '[Subject] Single vehicle',
+        'Task 3', f'Damage = {damage}',
+        'Task 4', 'NA',
+        'Task 5', 'Vehicle: Yes', 'Make: Toyota', 'Type: Sedan',
+        'Task 6', *visibility_lines,
+        'Task 7', 'Time = day',
+        'Task 8', 'Multiple = no',
+    ]) + '\n'
+
+# Entries where the parse_to_json.py rule (first Visibility line >= 50) and the Task 5 / damage script rule
+# (any Visibility line >= 45, .png/.jpg headers only) disagree
+EDGE_ENTRIES = [
+    edge_entry('edge/visibility_47.png:', 'Minor', ['Visibility = 47']),
+    edge_entry('edge/visibility_50.jpg:', 'Severe', ['Visibility = 50']),
+    edge_entry('edge/later_line_passes.png:', 'Moderate', ['Visibility = 30', 'Visibility = 60']),
+    edge_entry('edge/unparseable_first.png:', 'None', ['Visibility = high', 'Visibility = 46']),
+    edge_entry('edge/not_an_image.jpeg:', 'Severe', ['Visibility = 90']),
+    edge_entry('edge/too_low.png:', 'Minor', ['Visibility = 44']),
+]
+
+@pytest.fixture(params=['example', 'edge'])
+def input_file(request, tmp_path):
+    if request.param == 'example':
+        return EXAMPLE_INPUT
+    path = tmp_path / 'edge_cases.txt'
+    path.write_text('\n'.join(EDGE_ENTRIES))
+    return str(path)
+
+@pytest.fixture
+def pipeline_dir(input_file, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'pipeline'
+    output_dir.mkdir()
+    monkeypatch.setattr(pipeline, 'OUTPUT_DIR', str(output_dir))
+    monkeypatch.setattr(pipeline, 'CSV_OUTDIR', str(output_dir))
+    pipeline.run_pipeline(input_file, list(pipeline.SINK_FACTORIES))
+    return output_dir
+
+def standalone_dir(tmp_path):
+    output_dir = tmp_path / 'standalone'
+    output_dir.mkdir(exist_ok=True)
+    return output_dir
+
+def input_base(input_file):
+    return input_file.split('/')[-1].split('.')[0]
+
+def test_filtered_json_and_task_checks_match_parse_to_json(input_file, pipeline_dir, tmp_path, monkeypatch):
+    output_dir = standalone_dir(tmp_path)
+    monkeypatch.setattr(parse_to_json, 'INPUT_FILE', input_file)
+    monkeypatch.setattr(parse_to_json, 'OUTPUT_DIR', str(output_dir))
+    monkeypatch.setattr(parse_to_json, 'CSV_OUTDIR', str(output_dir))
+    monkeypatch.setattr(parse_to_json, 'OUTPUT_FORMAT', 'json')
+    parse_to_json.main()
+
+    for name in (f"{input_base(input_file)}_{pipeline.JSON_OUTPUT_SUFFIX}.json", f"{input_base(input_file)}_task_checks.csv"):
+        assert (pipeline_dir / name).read_bytes() == (output_dir / name).read_bytes()
+
+def test_task5_json_matches_parse_to_json_task_5(input_file, pipeline_dir, tmp_path, monkeypatch):
+    output_dir = standalone_dir(tmp_path)
+    monkeypatch.setattr(parse_to_json_task_5, 'INPUT_FILE', input_file)
+    monkeypatch.setattr(parse_to_json_task_5, 'OUTPUT_DIR', str(output_dir))
+    parse_to_json_task_5.main()
+
+    name = f"{input_base(input_file)}_task_5.json"
+    assert (pipeline_dir / name).read_bytes() == (output_dir / name).read_bytes()
+
+def test_damage_buckets_match_categorize_damage(input_file, pipeline_dir):
+    # categorize_damage.main goes on to rsync and caption the images, so its lists are built from the same functions
+    passing = [
+        entry_dict for entry_dict in categorize_damage.parse_to_dict(input_file)
+        if categorize_damage.check_task5_vehicle_yes(entry_dict) and categorize_damage.check_task6_visibility_45_plus(entry_dict)
+        and categorize_damage.check_task7_visibility_day(entry_dict) and categorize_damage.check_task8_multiple_no(entry_dict)
+    ]
+    minor, moderate, severe, none = categorize_damage.categorize_damage(passing)
+
+    with open(pipeline_dir / f"{input_base(input_file)}_damage_buckets.json") as f:
+        buckets = json.load(f)
+    assert buckets == {'Minor': minor, 'Moderate': moderate, 'Severe': severe, 'None': none}
+
+def test_training_csv_matches_parse_to_csv(input_file, pipeline_dir, tmp_path, monkeypatch):
+    output_dir = standalone_dir(tmp_path)
+    monkeypatch.setattr(parse_to_csv, 'INPUT_FILES', [input_file])
+    monkeypatch.setattr(parse_to_csv, 'OUTPUT_DIR', str(output_dir))
+    parse_to_csv.main()
+
+    for split_name in ('train', 'test', 'val'):
+        name = f"{pipeline.TRAINING_CSV_SUFFIX}_{split_name}.csv"
+        assert (pipeline_dir / name).read_bytes() == (output_dir / name).read_bytes()
+
+def test_edge_cases_pass_under_each_sinks_rule(tmp_path, monkeypatch):
+    # The rules really differ on the edge input, so the comparisons above can catch a sink using the wrong one
+    path = tmp_path / 'edge_cases.txt'
+    path.write_text('\n'.join(EDGE_ENTRIES))
+    monkeypatch.setattr(pipeline, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(pipeline, 'CSV_OUTDIR', str(tmp_path))
+    pipeline.run_pipeline(str(path), ['filtered_json', 'task5_json'])
+
+    with open(tmp_path / f"edge_cases_{pipeline.JSON_OUTPUT_SUFFIX}.json") as f:
+        assert [item['image'] for item in json.load(f)] == ['edge/visibility_50.jpg', 'edge/not_an_image.jpeg']
+    with open(tmp_path / 'edge_cases_task_5.json') as f:
+        assert [item['image'] for item in json.load(f)] == [
+            'edge/visibility_47.png', 'edge/visibility_50.jpg', 'edge/later_line_passes.png', 'edge/unparseable_first.png'
+        ]
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""WebDataset tar shards - each image's bytes packed with its captions into fixed-size shards written in parallel"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+# === CONFIGURATION ===
+IMAGE_BASE_DIR = '/home/cynapse/terence/database/blip/'  # Image paths in the CSVs are relative to this
+SHARD_MAX_BYTES = 1024 ** 3  # A shard is closed once its samples reach this size
+SHARD_MAX_SAMPLES = 100000  # ...or this many samples
+SHARD_WORKERS = 4  # Shards read and written at the same time, each by its own thread
+SHARD_WRITE_BUFFER = 8 * 1024 * 1024  # Bytes buffered per shard file so the disk sees large sequential writes
+TAR_MEMBER_OVERHEAD = 1024  # Header plus padding per tar member, counted against SHARD_MAX_BYTES
+
+def shard_pattern(shards_dir, prefix, shard_count):
+    """Brace pattern naming all shards of a directory, as WebDataset loaders take it"""
+    return os.path.join(shards_dir, f"{prefix}-{{{0:06d}..{max(shard_count - 1, 0):06d}}}.tar")
+
+def tar_member(name, size):
+    """TarInfo with fixed owner, mode and mtime so the same samples always give the same shard bytes"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o444
+    return info
+
+def write_shard(path, samples, image_base_dir):
+    """Write one shard of (key, image_path, captions) samples; returns its size in bytes"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb', buffering=SHARD_WRITE_BUFFER) as f, tarfile.open(fileobj=f, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+        for key, image_path, captions in samples:
+            extension = os.path.splitext(image_path)[1].lower().lstrip('.') or 'img'
+            with open(os.path.join(image_base_dir, image_path), 'rb') as image_file:
+                tar.addfile(tar_member(f"{key}.{extension}", os.fstat(image_file.fileno()).st_size), image_file)
+            for name, data in ((f"{key}.txt", '\n'.join(captions)),
+                               (f"{key}.json", json.dumps({'image_path': image_path, 'captions': captions}, ensure_ascii=False))):
+                data = data.encode('utf-8')
+                tar.addfile(tar_member(name, len(data)), io.BytesIO(data))
+    # Readers never see a half-written shard
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+def open_shard_stream(shards_dir, prefix, image_base_dir=IMAGE_BASE_DIR):
+    """Open a directory of {prefix}-NNNNNN.tar shards for streaming, returning (write_rows, close) like csv_stream.open_csv_stream
+
+    write_rows takes (image_path, caption) rows with each image's rows next to each other; every image becomes one
+    sample of its bytes plus a .txt (one caption per line) and .json (path and captions). Shard boundaries are
+    planned from file sizes as rows arrive, and full shards are read and written by a pool of threads.
+    close waits for the writers and returns (samples, shards, missing images, total bytes).
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix=f"shard-writer-{prefix}")
+    in_flight = []
+    shard = []
+    shard_bytes = 0
+    totals = {'samples': 0, 'shards': 0, 'missing': 0, 'bytes': 0}
+    open_sample = None  # (image_path, captions) still collecting rows
+
+    def submit_shard():
+        nonlocal shard, shard_bytes
+        if not shard:
+            return
+        path = os.path.join(shards_dir, f"{prefix}-{totals['shards']:06d}.tar")
+        in_flight.append(executor.submit(write_shard, path, shard, image_base_dir))
+        totals['shards'] += 1
+        shard = []
+        shard_bytes = 0
+        # Hold at most a couple of planned shards per writer
+        while len(in_flight) > SHARD_WORKERS * 2:
+            totals['bytes'] += in_flight.pop(0).result()
+
+    def add_sample(image_path, captions):
+        nonlocal shard_bytes
+        try:
+            image_size = os.path.getsize(os.path.join(image_base_dir, image_path))
+        except OSError:
+            totals['missing'] += 1
+            return
+        sample_bytes = image_size + 2 * sum(len(caption) for caption in captions) + len(image_path) + 3 * TAR_MEMBER_OVERHEAD
+        if shard and (shard_bytes + sample_bytes > SHARD_MAX_BYTES or len(shard) >= SHARD_MAX_SAMPLES):
+            submit_shard()
+        shard.append((f"{totals['samples']:09d}", image_path, captions))
+        shard_bytes += sample_bytes
+        totals['samples'] += 1
+
+    def write_rows(rows):
+        nonlocal open_sample
+        for image_path, caption in rows:
+            if open_sample is not None and open_sample[0] == image_path:
+                open_sample[1].append(caption)
+                continue
+            if open_sample is not None:
+                add_sample(*open_sample)
+            open_sample = (image_path, [caption])
+
+    def close():
+        if open_sample is not None:
+            add_sample(*open_sample)
+        submit_shard()
+        for future in in_flight:
+            totals['bytes'] += future.result()
+        executor.shutdown()
+        return totals['samples'], totals['shards'], totals['missing'], totals['bytes']
+
+    return write_rows, close
+
+def format_shard_report(shards_dir, prefix, totals):
+    """One-line summary of the shards close() reported"""
+    samples, shards, missing, total_bytes = totals
+    line = f"{shard_pattern(shards_dir, prefix, shards)} ({samples} samples in {shards} shards, {total_bytes / 1e9:.2f} GB)"
+    if missing:
+        line += f" - ⚠️  {missing} images not found under the image base directory were skipped"
+    return line
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack split caption CSVs and their images into WebDataset tar shards')
+    parser.add_argument('csv_files', nargs='+', help='(image_path, caption) CSVs (or .csv.gz), e.g. combined_blip_caption_csv_train.csv')
+    parser.add_argument('--image-base-dir', default=IMAGE_BASE_DIR, help='Directory the image paths are relative to')
+    parser.add_argument('--outdir', help='Where to put the shard directories (default: next to each CSV)')
+    parser.add_argument('--separator', default=',', help="CSV separator (',' or '\\t')")
+
+    args = parser.parse_args()
+
+    for csv_file in args.csv_files:
+        name = os.path.basename(csv_file).split('.')[0]
+        shards_dir = os.path.join(args.outdir or os.path.dirname(csv_file), f"{name}_shards")
+        write_rows, close = open_shard_stream(shards_dir, name, args.image_base_dir)
+        opener = gzip.open if csv_file.endswith('.gz') else open
+        with opener(csv_file, 'rt', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f, delimiter=args.separator)
+            next(reader, None)
+            batch = []
+            for row in reader:
+                batch.append((row[0], row[1]))
+                if len(batch) >= 4096:
+                    write_rows(batch)
+                    batch = []
+            write_rows(batch)
+        print(f"{csv_file} -> {format_shard_report(shards_dir, name, close())}")
+
+if __name__ == "__main__":
+    main()